@@ -1,41 +1,115 @@
 import os
 from collections import defaultdict
+import numpy as np
 import chess.pgn
-from io import StringIO
+from EvalRecord import Eval
+from GameResult import GameResult
+import PgnLite
 
-# Internal helpers
-def _pdiff(results):
-    return [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for ev,_,_,c,*_ in results for i in range(1,len(ev)) if c is None or i%2==c]
+# Metrics frame
+class Frame:
+    """A dataset's results flattened once into NumPy arrays; every metric is a group-by over them.
 
-def _metric(results, fn):
-    diffs = fn(results)
-    return sum(diffs)/len(diffs) if diffs else 0
+    Per move i>=1 of each game: loss (centipawns lost by the mover), swing, piece moved,
+    game index g and `mine` (moved by the tracked side, or any side when untracked).
+    Per game: color (-1 untracked), elo, won (-1 undecided), resigned, hour and game
+    number (-1 when unknown). None results become empty games that count nowhere;
+    old positional tuples are read as GameResults.
+    """
 
-# Metrics
+    def __init__(self, results):
+        results = [r if isinstance(r, GameResult) else GameResult(*r) if r else _EMPTY for r in results]
+        n = len(results)
+        lens = np.fromiter((len(r.evals) for r in results), np.int64, n)
+        ev = _cat(r.evals for r in results).astype(np.float64)
+        pcs = _cat(r.piece_types[:len(r.evals)] for r in results)
+        g = np.repeat(np.arange(n), lens)
+        i = np.arange(len(ev)) - np.repeat(np.cumsum(lens) - lens, lens)
+        step = np.diff(ev, prepend=0.0)
+        keep = i >= 1
+        self.n, self.g, i, step = n, g[keep], i[keep], step[keep]
+        self.odd = (i & 1).astype(bool)
+        self.loss = np.maximum(0, np.where(self.odd, -step, step))
+        self.swing = np.abs(step)
+        self.piece = pcs[np.flatnonzero(keep) - 1]
+        self.pawns = _cat(r.pawn_counts for r in results)
+        self.best = _cat(r.best_moves for r in results)
+        self.color = np.fromiter((_or_neg(r.color) for r in results), np.int64, n)
+        self.elo = np.fromiter((r.elo or 0 for r in results), np.int64, n)
+        self.won = np.fromiter((_or_neg(r.won) for r in results), np.int64, n)
+        self.resigned = np.fromiter((r.is_resignation for r in results), bool, n)
+        self.hour = np.fromiter((_or_neg(r.hour) for r in results), np.int64, n)
+        self.game_num = np.fromiter((_or_neg(r.game_num) for r in results), np.int64, n)
+        c = self.color[self.g]
+        self.mine = (c < 0) | (self.odd == (c == 1))
+
+    def game_acpl(self, color):
+        """Per-game ACPL of the moves `color` made (chess.WHITE/BLACK), 0 where it made none."""
+        m = self.odd if color == chess.WHITE else ~self.odd
+        s, k = np.bincount(self.g[m], self.loss[m], self.n), np.bincount(self.g[m], minlength=self.n)
+        return np.divide(s, k, out=np.zeros(self.n), where=k > 0)
+
+    def grouped(self, key):
+        """({key: ACPL}, {key: win %}) over games with key >= 0; key is one value per game."""
+        k = key[self.g]
+        m = self.mine & (k >= 0)
+        s, cnt = np.bincount(k[m], self.loss[m]), np.bincount(k[m])
+        dec = (key >= 0) & (self.won >= 0)
+        w, d = np.bincount(key[dec], self.won[dec] == 1), np.bincount(key[dec])
+        return ({int(h): float(s[h]) / int(cnt[h]) for h in np.flatnonzero(cnt)},
+                {int(h): 100 * int(w[h]) / int(d[h]) for h in np.flatnonzero(d)})
+
+    def counts(self, key):
+        """{key: games} over games with key >= 0."""
+        c = np.bincount(key[key >= 0])
+        return {int(h): int(c[h]) for h in np.flatnonzero(c)}
+
+
+_EMPTY = GameResult()
+
+def _or_neg(v):
+    return -1 if v is None else int(v)
+
+def _cat(arrays):
+    """Concatenate typed arrays of one typecode into a NumPy array, via a single bytes join."""
+    arrays = list(arrays)
+    if not arrays: return np.zeros(0, np.int64)
+    return np.frombuffer(b"".join(a.tobytes() for a in arrays), arrays[0].typecode).astype(np.int64)
+
+def _frame(results):
+    return results if isinstance(results, Frame) else Frame(results)
+
+def _mean(x):
+    return float(x.sum()) / len(x) if len(x) else 0
+
+def _resign_rate(f):
+    lost = f.won == 0
+    return 100 * int(f.resigned[lost].sum()) / int(lost.sum()) if lost.any() else 0
+
+# Metrics (each takes a Frame)
 METRICS = {
-    'acpl': lambda r: _metric(r, _pdiff),
-    'sharpness': lambda r: _metric(r, lambda x: [abs(ev[i]-ev[i-1]) for ev,*_ in x for i in range(1,len(ev))]),
-    'closedness': lambda r: _metric(r, lambda x: [pc for _,_,pws,*_ in x for pc in pws]),
-    'resign_rate': lambda r: (100*sum(1 for x in lost if x[8])/len(lost) if (lost:=[x for x in r if x[7] is False]) else 0),
-    'best_move_rate': lambda r: 100*_metric(r, lambda x: [b for *_,bms,_,_ in x for b in bms]),
+    'acpl': lambda f: _mean(f.loss[f.mine]),
+    'sharpness': lambda f: _mean(f.swing),
+    'closedness': lambda f: _mean(f.pawns),
+    'resign_rate': _resign_rate,
+    'best_move_rate': lambda f: 100*_mean(f.best),
 }
 
 # Per-piece metrics
 def pmetrics(results):
-    acpl, cnt = defaultdict(float), defaultdict(int)
-    for ev,pcs,_,c,*_ in results:
-        for i in range(1,len(ev)):
-            if c is None or i%2==c:
-                diff = max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1])
-                acpl[pcs[i-1]] += diff
-                cnt[pcs[i-1]] += 1
-    total_moves = sum(cnt.values()) or 1
-    return {p: acpl[p]/cnt[p] for p in acpl if cnt[p]}, {p: 100*cnt[p]/total_moves for p in cnt}
+    f = _frame(results)
+    p = f.piece[f.mine]
+    s, cnt = np.bincount(p, f.loss[f.mine]), np.bincount(p)
+    total_moves = int(cnt.sum()) or 1
+    keys = np.flatnonzero(cnt)
+    return ({int(k): float(s[k]) / int(cnt[k]) for k in keys},
+            {int(k): 100 * int(cnt[k]) / total_moves for k in keys})
 
 # Castle & turn metrics
 def cmetrics(results):
     side, turn = defaultdict(lambda:[0,0]), defaultdict(lambda:[0,0])
-    for *_,ct,cs,won,_,_,_,_ in results:
+    for r in results:
+        ct, cs, won = r.castle_turn, r.castle_side, r.won
         if cs and won is not None:
             side[cs][won] += 1
             grp = ("<=4" if ct<=4 else "5-6" if ct<=6 else "7-8" if ct<=8 else "9-10" if ct<=10 else "11-12" if ct<=12 else "13-15" if ct<=15 else ">15")
@@ -44,41 +118,32 @@ def cmetrics(results):
 
 # Time & game metrics
 def tmetrics(results):
-    acpl, wins = defaultdict(list), defaultdict(lambda:[0,0])
-    for ev,_,_,c,_,_,_,won,_,_,h,_ in results:
-        if h is not None:
-            diffs = [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for i in range(1,len(ev)) if c is None or i%2==c]
-            if diffs: acpl[h].extend(diffs)
-            if won is not None: wins[h][won] += 1
-    return {h:sum(d)/len(d) for h,d in acpl.items() if d}, {h:100*v[1]/sum(v) if sum(v) else 0 for h,v in wins.items()}
+    f = _frame(results)
+    return f.grouped(f.hour)
 
 def gmetrics(results):
-    acpl, wins = defaultdict(list), defaultdict(lambda:[0,0])
-    for ev,_,_,c,_,_,_,won,_,_,_,gn in results:
-        if gn is not None:
-            diffs = [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for i in range(1,len(ev)) if c is None or i%2==c]
-            if diffs: acpl[gn].extend(diffs)
-            if won is not None: wins[gn][won] += 1
-    return {g:sum(d)/len(d) for g,d in acpl.items() if d}, {g:100*v[1]/sum(v) if sum(v) else 0 for g,v in wins.items()}
+    f = _frame(results)
+    return f.grouped(f.game_num)
 
 # ECO stats
 def eco_stats(pgns, res, users=None):
     ew, eb = defaultdict(lambda:{'a':[],'w':0,'l':0}), defaultdict(lambda:{'a':[],'w':0,'l':0})
     ul = [u.lower() for u in (users or [])]
-    for pgn,rs in zip(pgns,res):
+    if not ul: return {}, {}
+    res = list(res)
+    f = Frame(res)
+    acpl = {chess.WHITE: f.game_acpl(chess.WHITE).tolist(), chess.BLACK: f.game_acpl(chess.BLACK).tolist()}
+    for j,(pgn,rs) in enumerate(zip(pgns,res)):
         if not rs: continue
         try:
-            g = chess.pgn.read_game(StringIO(pgn)) if isinstance(pgn,str) else pgn
-            if not g or not (eco:=g.headers.get("ECO")): continue
-            w,b = g.headers.get("White","").lower(), g.headers.get("Black","").lower()
+            h = PgnLite.headers_of(pgn)
+            if not (eco:=h.get("ECO")): continue
+            w,b = h.get("White","").lower(), h.get("Black","").lower()
             c = chess.WHITE if w in ul else chess.BLACK if b in ul else None
-            ev,*rest = rs
-            diffs = [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for i in range(1,len(ev)) if c is None or i%2==c]
-            a = sum(diffs)/len(diffs) if diffs else 0
             ed = ew if c==chess.WHITE else eb if c==chess.BLACK else None
             if ed:
-                ed[eco]['a'].append(a)
-                if rest[5] is not None: ed[eco]['w' if rest[5] else 'l'] += 1
+                ed[eco]['a'].append(acpl[c][j])
+                if rs.won is not None: ed[eco]['w' if rs.won else 'l'] += 1
         except Exception: pass
     def summar(d):
         return {e:{'a':sum(v['a'])/len(v['a']) if v['a'] else 0, 'w':100*v['w']/(v['w']+v['l']) if v['w']+v['l'] else 0, 'n':v['w']+v['l']} for e,v in d.items() if v['a']}
@@ -87,8 +152,9 @@ def eco_stats(pgns, res, users=None):
 # Print stats
 def print_stats(lbls, dsets, pgn_sets=None, res_sets=None, user=None):
     pn = {1:"P",2:"N",3:"B",4:"R",5:"Q",6:"K"}
-    stats = [{k:f(d) for k,f in METRICS.items()} for d in dsets]
-    ps, cs, ts, gs = [pmetrics(d) for d in dsets], [cmetrics(d) for d in dsets], [tmetrics(d) for d in dsets], [gmetrics(d) for d in dsets]
+    frames = [Frame(d) for d in dsets]
+    stats = [{k:fn(f) for k,fn in METRICS.items()} for f in frames]
+    ps, cs, ts, gs = [pmetrics(f) for f in frames], [cmetrics(d) for d in dsets], [tmetrics(f) for f in frames], [gmetrics(f) for f in frames]
     counts = [len(d) for d in dsets]
     w = 9 + 8*len(lbls)
     print(f"\n{'Metric':<9} " + ' '.join(f"{l:>7}" for l in lbls) + f"\n{'='*w}")
@@ -118,60 +184,99 @@ def print_stats(lbls, dsets, pgn_sets=None, res_sets=None, user=None):
                         for eco,d in sorted(data.items(),key=lambda x:-x[1]['n'])[:10]:
                             print(f"    {eco} n:{d['n']:>2} A:{d['a']:>5.1f} W:{d['w']:>5.1f}%")
     if dsets:
-        user_games = dsets[0]
+        user_frame = frames[0]
         if gs[0][0] or gs[0][1]:
             print(f"\n{lbls[0]} Game# per Day:")
-            keys = sorted(set(gs[0][0]) | set(gs[0][1]))
+            keys, n = sorted(set(gs[0][0]) | set(gs[0][1])), user_frame.counts(user_frame.game_num)
             for g in keys:
-                n = sum(1 for ev,*_,_,_,_,_,_,_,_,_,gn in user_games if gn==g)
-                print(f"  {g:>2} \tA:{gs[0][0].get(g,0):>5.1f} \tW:{gs[0][1].get(g,0):>5.1f}% \tn={n:>3}")
+                print(f"  {g:>2} \tA:{gs[0][0].get(g,0):>5.1f} \tW:{gs[0][1].get(g,0):>5.1f}% \tn={n.get(g,0):>3}")
         print(f"\n{lbls[0]} Time of Day:")
+        n = user_frame.counts(user_frame.hour)
         for h in range(24):
-            n = sum(1 for ev,*_,_,_,_,_,_,_,_,hr,_ in user_games if hr==h)
-            print(f"  {h:02d}h \tA:{ts[0][0].get(h,0):>5.1f} \tW:{ts[0][1].get(h,0):>5.1f}% \tn={n:>3}")
+            print(f"  {h:02d}h \tA:{ts[0][0].get(h,0):>5.1f} \tW:{ts[0][1].get(h,0):>5.1f}% \tn={n.get(h,0):>3}")
     return {"counts":counts,"metrics":stats,"piece_metrics":ps,"castle_metrics":cs,"time_metrics":ts,"game_metrics":gs}
 
 # Speedup helpers
-def fast_eval_fens(fens, engine_path, depth=12, threads=1, procs=4, hash_mb=64, cache=True):
-    if not fens: return []
-    from multiprocessing import Pool
-    import atexit, hashlib
-    seen, unique, idxs = {}, [], []
-    for i,f in enumerate(fens):
-        k = f if not cache else hashlib.md5(f.encode()).hexdigest()
-        if k in seen:
-            idxs.append(seen[k])
-        else:
-            seen[k] = len(unique)
-            unique.append(f)
-            idxs.append(seen[k])
-    def _init_worker(ep,th,hm,dp):
-        global _ENGINE,_DEPTH
-        import chess,chess.engine
-        _DEPTH = dp
-        _ENGINE = chess.engine.SimpleEngine.popen_uci(ep)
-        try: _ENGINE.configure({"Threads":th,"Hash":hm})
-        except: pass
-        atexit.register(lambda: _ENGINE.quit())
-    def _worker(fen):
-        import chess
+# Pool workers live at module level so multiprocessing can pickle them; each process owns one engine.
+_ENGINE, _ENGINE_ARGS, _LIMIT = None, None, None
+
+def _start_engine():
+    global _ENGINE
+    import chess.engine, multiprocessing
+    from multiprocessing.util import Finalize
+    ep, th, hm, opts, cpus = _ENGINE_ARGS
+    # pool workers are numbered from 1; spread their engines over the planned CPU sets
+    w = (multiprocessing.current_process()._identity or (1,))[0]
+    mine = cpus[(w - 1) % len(cpus)] if cpus else None
+    _ENGINE = chess.engine.SimpleEngine.popen_uci(ep, **({"preexec_fn": lambda: os.sched_setaffinity(0, mine)}
+                                                          if mine else {}))
+    try: _ENGINE.configure({k: v for k, v in {"Threads":th,"Hash":hm,**opts}.items() if k in _ENGINE.options})
+    except Exception: pass
+    Finalize(_ENGINE, _ENGINE.quit, exitpriority=10)
+
+def _init_worker(ep, th, hm, dp, opts=None, cpus=None):
+    global _ENGINE_ARGS, _LIMIT
+    import chess.engine
+    _ENGINE_ARGS, _LIMIT = (ep, th, hm, opts or {}, cpus), chess.engine.Limit(depth=dp)
+    _start_engine()
+
+def _worker(job):
+    import chess.engine
+    i, fen = job
+    for attempt in range(2):
         try:
-            board = chess.Board(fen)
-            info = _ENGINE.analyse(board, chess.engine.Limit(depth=_DEPTH))
-            sc = info.get("score")
-            if sc is None: return 0
-            try:
-                val = sc.white().score(mate_score=100000)
-                return 0 if val is None else val
-            except: return 0
-        except: return 0
-    with Pool(processes=procs, initializer=_init_worker, initargs=(engine_path,threads,hash_mb,depth)) as P:
-        out = P.map(_worker, unique)
-    return [out[i] for i in idxs]
+            info = _ENGINE.analyse(chess.Board(fen), _LIMIT)
+            return i, Eval.from_info(info, _LIMIT.depth).pack()
+        except chess.engine.EngineTerminatedError:
+            if attempt == 0: _start_engine()
+        except Exception:
+            break
+    return i, None
+
+def iter_eval_fens(fens, engine_path, depth=12, threads=None, procs=None, hash_mb=None, chunksize=16, plan=None):
+    """Yield (index, Eval) as each FEN finishes; workers ship 10-byte packed records back.
+
+    procs/threads/hash_mb left as None come from ResourcePlan.plan (or the plan passed in).
+    """
+    if not fens: return
+    from multiprocessing import Pool
+    import ResourcePlan
+    p = plan or ResourcePlan.plan(procs, threads, hash_mb)
+    P = Pool(processes=p.engines, initializer=_init_worker,
+             initargs=(engine_path, p.threads, p.hash_mb, depth, p.options(), p.cpus))
+    try:
+        for i, b in P.imap_unordered(_worker, enumerate(fens), chunksize=max(1, chunksize)):
+            yield i, Eval.unpack(b) if b else None
+        P.close()
+    except BaseException:
+        P.terminate()
+        raise
+    finally:
+        P.join()
+
+def _summary(ev):
+    if not ev: return (0, None, False)
+    mv = ev.best_move()
+    return (ev.white_score(mate_score=100000) or 0, mv.uci() if mv else None, ev.is_mate())
+
+def fast_eval_fens(fens, engine_path, depth=12, threads=None, procs=None, hash_mb=None, cache=None, chunksize=16):
+    """(white-POV cp, best move UCI, is_mate) per FEN; cache=DiskMemCache serves hits and stores misses."""
+    if not fens: return []
+    unique = list(dict.fromkeys(fens))
+    infos, cache = {}, cache if hasattr(cache, "get_many") else None
+    if cache is not None:
+        hits, _ = cache.get_many((f, depth) for f in unique)
+        infos = {f: v for (f, _), v in hits.items()}
+    todo = [f for f in unique if f not in infos]
+    done = []
+    for i, info in iter_eval_fens(todo, engine_path, depth, threads, procs, hash_mb, chunksize):
+        infos[todo[i]] = info
+        if info: done.append((todo[i], depth, info))
+    if done and cache is not None: cache.put_many(done)
+    return [_summary(infos.get(f)) for f in fens]
 
 def pgn_extract_fens(pgn_text_or_game, per_move=True):
-    import chess.pgn
-    g = chess.pgn.read_game(StringIO(pgn_text_or_game)) if isinstance(pgn_text_or_game,str) else pgn_text_or_game
+    g = PgnLite.parse(pgn_text_or_game)
     if not g: return []
     if not per_move: return [g.board().fen()]
     b = g.board()
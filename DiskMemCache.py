@@ -1,10 +1,138 @@
-import gzip, pickle, hashlib, heapq, time
-from collections import defaultdict, OrderedDict
+import gzip, pickle, hashlib, heapq, itertools, os, threading, time
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 
+from EvalRecord import Eval, depth_of
+from PositionStore import SqliteStore
+
+_SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+CLOCK_HORIZON = 80
+
+
+def canonical(fen, clock_horizon=CLOCK_HORIZON):
+    # board, side, castling, ep; the clocks only matter once the 50-move rule is in sight
+    parts = fen.split()
+    canon = " ".join(parts[:4])
+    if len(parts) > 4 and parts[4].isdigit() and int(parts[4]) >= clock_horizon:
+        canon += " " + parts[4]
+    return canon
+
+
+def position_key(fen, clock_horizon=CLOCK_HORIZON):
+    """The 64-bit key a position is cached under: blake2b of its canonical FEN."""
+    m = hashlib.blake2b(canonical(fen, clock_horizon).encode('utf-8'), digest_size=8)
+    return int.from_bytes(m.digest(), 'little')
+
+
+class _Lfu:
+    """O(1) LFU index: keys live in per-frequency buckets, LRU order inside a bucket.
+
+    With aging (LFU-DA) a new key starts just above the frequency of the last
+    victim, so entries that were hot long ago sink below newly hot ones.
+    """
+    __slots__ = ("freq", "buckets", "min_p", "age", "aging", "cap")
+
+    def __init__(self, aging=True, cap=1_000_000_000):
+        self.freq, self.buckets = {}, {}
+        self.min_p = self.age = 0
+        self.aging, self.cap = aging, cap
+
+    def __len__(self):
+        return len(self.freq)
+
+    def add(self, k, p=None):
+        p = min(self.cap, max(self.age + 1, p or 0))
+        self.freq[k] = p
+        self._link(k, p)
+
+    def touch(self, k):
+        p = self.freq[k]
+        np = min(self.cap, p + 1)
+        self.freq[k] = np
+        self._link(k, np)  # link first so _unlink finds the new bucket when p was the minimum
+        self._unlink(k, p) if np != p else None
+
+    def evict(self):
+        p = self.min_p
+        k = next(iter(self.buckets[p]))
+        del self.freq[k]
+        self._unlink(k, p)
+        if self.aging: self.age = p
+        return k
+
+    def remove(self, k):
+        self._unlink(k, self.freq.pop(k))
+
+    def _link(self, k, p):
+        b = self.buckets.get(p)
+        if b is None:
+            b = self.buckets[p] = {}
+        b.pop(k, None)
+        b[k] = None
+        if len(self.buckets) == 1 or p < self.min_p:
+            self.min_p = p
+
+    def _unlink(self, k, p):
+        b = self.buckets[p]
+        del b[k]
+        if b: return
+        del self.buckets[p]
+        if p != self.min_p or not self.buckets: return
+        for q in range(p + 1, p + 9):  # the next bucket is almost always adjacent
+            if q in self.buckets:
+                self.min_p = q
+                return
+        self.min_p = min(self.buckets)
+
+
+class _Shard:
+    """One lock stripe: its own entries, LFU index and counters."""
+    __slots__ = ("lock", "cache", "lfu", "hits", "misses", "shallow", "evictions")
+
+    def __init__(self, aging=True):
+        self.lock = threading.Lock()
+        self.cache, self.lfu = {}, _Lfu(aging)
+        self.hits = self.misses = self.shallow = self.evictions = 0
+
+    @property
+    def freq(self):
+        return self.lfu.freq
+
+    def evict_to(self, cap):
+        cache, lfu, n = self.cache, self.lfu, 0
+        while len(cache) > cap:
+            cache.pop(lfu.evict(), None)
+            n += 1
+        self.evictions += n
+        return n
+
 
 class DiskMemCache:
-    """Persistent LFU cache (frequency-based) for Stockfish or similar analysis."""
+    """Persistent LFU cache (frequency-based) for Stockfish or similar analysis.
+
+    One entry per position holding the deepest result seen; a lookup at depth d
+    is served by any entry searched to depth >= d. Values are stored as packed
+    10-byte EvalRecord.Eval records and handed back as Eval tuples.
+
+    backend="pickle" keeps everything in memory and snapshots it to a .pkl.gz;
+    backend="sqlite" (the default for .db/.sqlite files) reads through to a
+    memory-mapped SQLite file, appends puts in batches and keeps only the hot
+    max_cache_size entries in memory. The file is opened on first use, so
+    load() is optional there.
+
+    Persistence never happens on the lookup path: a writer thread checkpoints
+    changes every flush_interval seconds (sooner once flush_every puts pile up)
+    and once more at interpreter exit.
+
+    Safe to share between threads: keys are striped over `shards` locks, each
+    shard counts and prunes itself, so contention and pruning stay local.
+
+    Eviction is O(1) per insert (see _Lfu); aging=False gives plain LFU.
+    trace_file records every lookup key so simulate_policies() can replay
+    real access patterns against other policies and sizes.
+    """
 
     def __init__(self,
                  cache_file="position_cache.pkl.gz",
@@ -12,70 +140,119 @@ class DiskMemCache:
                  check_interval=499,
                  max_cache_size=50_000,
                  periodic_save=True,
-                 key_cache_size=9_000):
+                 key_cache_size=9_000,
+                 clock_horizon=CLOCK_HORIZON,
+                 backend=None,
+                 flush_every=1_000,
+                 flush_interval=30.0,
+                 shards=16,
+                 aging=True,
+                 trace_file=None):
         self.cache_file = Path(cache_file)
-        self.cache, self.freq = {}, defaultdict(int)
-        self.hits = self.misses = self.lookup_count = 0
         self.prune_threshold = float(prune_threshold)
         self.check_interval = max(1, int(check_interval))
         self.max_cache_size = int(max_cache_size)
         self.periodic_save = periodic_save
-        self._key_cache = OrderedDict()
-        self._key_cache_size = max(1000, key_cache_size)
-        self._soft_cap_mult = 1.2
-        self._freq_cap = 1_000_000_000
+        n = 1 << max(0, int(shards) - 1).bit_length()
+        self._shards, self._mask = [_Shard(aging) for _ in range(n)], n - 1
+        self._shard_cap = max(1, -(-self.max_cache_size // n))
+        self._lookups = itertools.count(1)
+        self._key = lru_cache(maxsize=max(1000, key_cache_size))(self._compute_key)
         self._last_prune_time = None
+        self.clock_horizon = int(clock_horizon)
+        self._legacy_n, self._migrated = 0, False
+        self.backend = backend or ("sqlite" if self.cache_file.suffix in _SQLITE_SUFFIXES else "pickle")
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = float(flush_interval)
+        self._store, self._dirty = None, {}
+        self._put_seq = itertools.count(1)
+        self._last_put = self._saved_puts = 0
+        self._lock, self._dirty_lock, self._io_lock = threading.Lock(), threading.Lock(), threading.Lock()
+        self._wake, self._stop, self._writer = threading.Event(), threading.Event(), None
+        self.trace_file = Path(trace_file) if trace_file else None
+        self._trace = [] if trace_file else None
 
     # ---------- Core API ----------
 
     def get(self, fen, depth):
-        k = self._key(fen, depth)
-        v = self.cache.get(k)
-        if v is not None:
-            self.hits += 1
-            self.freq[k] = min(self._freq_cap, self.freq.get(k, 0) + 1)
-        else:
-            self.misses += 1
-        self.lookup_count += 1
-        self._maybe_prune()
-        return v
+        k = self._key(fen)
+        sh = self._shard(k)
+        if self._trace is not None: self._trace.append(k)
+        if k not in sh.cache:
+            if self._disk() is not None:
+                self._fault_in([k])
+            if self._legacy_n and not self._migrated and k not in sh.cache:
+                self._adopt_legacy(fen, depth, k)
+        with sh.lock:
+            v = sh.cache.get(k)
+            if v is not None and depth_of(v) < depth:
+                v, sh.shallow = None, sh.shallow + 1
+            if v is not None:
+                sh.hits += 1
+                sh.lfu.touch(k)
+            else:
+                sh.misses += 1
+        self._maybe_checkpoint()
+        return Eval.unpack(v) if v is not None else None
 
     def get_many(self, positions):
         hits, misses = {}, []
-        fget, cache, freq, cap = self.freq.get, self.cache, self.freq, self._freq_cap
-        for fen, depth in positions:
-            k = self._key(fen, depth)
-            v = cache.get(k)
+        positions = [(fen, depth, self._key(fen)) for fen, depth in positions]
+        if self._trace is not None: self._trace.extend(k for _, _, k in positions)
+        if self._disk() is not None:
+            self._fault_in([k for _, _, k in positions if k not in self._shard(k).cache])
+        for fen, depth, k in positions:
+            sh = self._shard(k)
+            if self._legacy_n and not self._migrated and k not in sh.cache:
+                self._adopt_legacy(fen, depth, k)
+            with sh.lock:
+                v = sh.cache.get(k)
+                if v is not None and depth_of(v) < depth:
+                    v, sh.shallow = None, sh.shallow + 1
+                if v is not None:
+                    sh.lfu.touch(k)
+                    sh.hits += 1
+                else:
+                    sh.misses += 1
             if v is not None:
-                hits[(fen, depth)] = v
-                freq[k] = min(cap, fget(k, 0) + 1)
-                self.hits += 1
+                hits[(fen, depth)] = Eval.unpack(v)
             else:
                 misses.append((fen, depth))
-                self.misses += 1
-            self.lookup_count += 1
-        self._maybe_prune()
+            self._maybe_checkpoint()
         return hits, misses
 
     def put(self, fen, depth, value):
-        k = self._key(fen, depth)
-        self.cache[k] = value
-        self.freq[k] = min(self._freq_cap, self.freq.get(k, 0) + 1)
-        if len(self.cache) > self.max_cache_size * self._soft_cap_mult:
-            self._prune_in_memory()
+        self._put(self._key(fen), depth, value)
+        self._after_put()
 
     def put_many(self, results):
-        freq, cache, cap = self.freq, self.cache, self._freq_cap
         for fen, depth, value in results:
-            k = self._key(fen, depth)
-            cache[k] = value
-            freq[k] = min(cap, freq.get(k, 0) + 1)
-        if len(cache) > self.max_cache_size * self._soft_cap_mult:
-            self._prune_in_memory()
+            self._put(self._key(fen), depth, value)
+        self._after_put()
+
+    def shallower(self, fens, depth):
+        """FENs that are cached, but only below `depth` -- what an upgrade pass re-analyses."""
+        out, fens = [], [(fen, self._key(fen)) for fen in fens]
+        if self._disk() is not None:
+            self._fault_in([k for _, k in fens if k not in self._shard(k).cache])
+        for fen, k in fens:
+            v = self._shard(k).cache.get(k)
+            if v is not None and depth_of(v) < depth:
+                out.append(fen)
+        return out
+
+    def __len__(self):
+        return sum(len(sh.cache) for sh in self._shards)
 
     # ---------- Persistence ----------
 
     def load(self):
+        if self.backend == "sqlite":
+            self._disk()
+            self._legacy_n = self._store.count("legacy")
+            print(f"  ✓ opened {self.cache_file} ({self._store.count()} positions on disk)"
+                  + (f" ({self._legacy_n} legacy full-FEN keys, migrated on first hit)" if self._legacy_n else ""))
+            return
         if not self.cache_file.exists():
             print(f"  ! cache file {self.cache_file} does not exist")
             return
@@ -84,111 +261,366 @@ class DiskMemCache:
                 data = pickle.load(f)
         except Exception as e:
             print(f"  ! failed to load cache: {e}")
-            self.cache, self.freq = {}, defaultdict(int)
+            self._replace({}, {})
             return
         if isinstance(data, dict) and 'cache' in data:
-            self.cache = data.get('cache', {})
-            self.freq = defaultdict(int, data.get('freq', {}))
+            cache, freq = data.get('cache', {}), data.get('freq', {})
         else:
-            self.cache, self.freq = data, defaultdict(int)
-        for k in self.cache:
-            self.freq.setdefault(k, 1)
-        print(f"  ✓ loaded {len(self.cache)} positions from {self.cache_file}")
+            cache, freq = data, {}
+        cache = {k: v if isinstance(v, bytes) else Eval.from_info(v).pack() for k, v in cache.items()}
+        self._replace(cache, freq)
+        self._legacy_n = sum(1 for k in cache if isinstance(k, str))
+        print(f"  ✓ loaded {len(cache)} positions from {self.cache_file}"
+              + (f" ({self._legacy_n} legacy full-FEN keys, migrated on first hit)" if self._legacy_n else ""))
 
     def save(self):
-        if not self.cache:
+        """Synchronous checkpoint; in pickle mode also trims memory to max_cache_size."""
+        if self.backend == "sqlite":
+            n = self.flush()
+            self._reset_stats()
+            print(f"  ✓ flushed {n} positions to {self.cache_file}")
             return
-        n = len(self.cache)
+        cache, freq = self._snapshot()
+        if not cache:
+            return
+        n = len(cache)
         print(f"  - saving: before trim {n} positions (max {self.max_cache_size})")
-        if n <= self.max_cache_size:
-            top_keys = set(self.cache)
-        else:
-            items = ((self.freq.get(k, 1), k) for k in self.cache)
-            top_keys = {
-                k
-                for _, k in heapq.nlargest(
-                    self.max_cache_size, items, key=lambda x: x[0])
-            }
-        trimmed_cache = {k: self.cache[k] for k in top_keys}
-        trimmed_freq = {k: self.freq.get(k, 1) for k in top_keys}
-        m = len(trimmed_cache)
-        data = {'cache': trimmed_cache, 'freq': trimmed_freq}
-        tmp = self.cache_file.with_suffix('.tmp')
+        with self._io_lock:
+            puts = self._last_put
+            kept, _ = self._write_snapshot(cache, freq)
+            self._saved_puts = puts
+        drop = cache.keys() - kept.keys()
+        for sh in self._shards:
+            with sh.lock:
+                for k in drop & sh.cache.keys():
+                    sh.cache.pop(k, None)
+                    sh.lfu.remove(k)
+        if self._legacy_n:
+            self._legacy_n = sum(1 for k in kept if isinstance(k, str))
+        self._reset_stats()
+        self._last_prune_time = time.time()
+        print(f"  ✓ saved {len(kept)} positions to {self.cache_file} (trimmed from {n})")
+
+    def flush(self):
+        """Persist everything changed since the last checkpoint; returns how many entries were written."""
+        with self._io_lock:
+            self._flush_trace()
+            if self.backend == "sqlite":
+                with self._dirty_lock:
+                    dirty, self._dirty = self._dirty, {}
+                if dirty:
+                    self._disk().put_many((k, v, self._shard(k).freq.get(k, 1)) for k, v in dirty.items())
+                return len(dirty)
+            puts = self._last_put
+            if puts == self._saved_puts:
+                return 0
+            cache, freq = self._snapshot()
+            if not cache:
+                return 0
+            written, _ = self._write_snapshot(cache, freq)
+            self._saved_puts = puts
+            return len(written)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._writer and self._writer is not threading.current_thread():
+            self._writer.join()
+        self._writer = None
+        if self.backend == "sqlite":
+            # nothing can be dirty unless the store was opened, so don't open one just to close it
+            if self._store is not None:
+                self.flush()
+                self._store.close()
+                self._store = None
+        elif self.periodic_save:
+            self.flush()
+
+    def import_pickle(self, pkl_file):
+        """Copy an existing .pkl.gz cache (baseline or current format) into this SQLite-backed cache."""
+        if self.backend != "sqlite":
+            raise ValueError("import_pickle needs the sqlite backend")
+        if self._store is None:
+            self.load()
+        old = DiskMemCache(pkl_file, backend="pickle", periodic_save=False)
+        old.load()
+        cache, freq = old._snapshot()
+        cur = [(k, v, freq.get(k, 1)) for k, v in cache.items() if not isinstance(k, str)]
+        leg = [(k, v, freq.get(k, 1)) for k, v in cache.items() if isinstance(k, str)]
+        self._store.put_many(cur)
+        self._store.put_legacy(leg)
+        self._legacy_n = self._store.count("legacy")
+        print(f"  ✓ imported {len(cur)} positions and {len(leg)} legacy entries from {pkl_file}")
+        return len(cur) + len(leg)
+
+    # ---------- Internals ----------
+
+    def _shard(self, k):
+        return self._shards[hash(k) & self._mask]
+
+    def _disk(self):
+        # the sqlite backend opens its store on first use, whether or not load() ran; pickle mode has none
+        if self._store is None and self.backend == "sqlite":
+            with self._lock:
+                if self._store is None:
+                    self._store = SqliteStore(self.cache_file)
+        return self._store
+
+    def _snapshot(self):
+        # per-shard C-level copies: consistent even while other threads keep inserting
+        cache, freq = {}, {}
+        for sh in self._shards:
+            with sh.lock:
+                cache.update(sh.cache)
+                freq.update(sh.freq)
+        return cache, freq
+
+    def _replace(self, cache, freq):
+        for sh in self._shards:
+            with sh.lock:
+                sh.cache, sh.lfu = {}, _Lfu(sh.lfu.aging)
+        for k in sorted(cache, key=lambda k: freq.get(k, 1)):
+            sh = self._shard(k)
+            sh.cache[k] = cache[k]
+            sh.lfu.add(k, freq.get(k, 1))
+        for sh in self._shards:
+            # new keys start level with the coldest loaded entry, not below everything
+            sh.lfu.age = max(0, sh.lfu.min_p - 1) if len(sh.lfu) else 0
+            sh.evict_to(self._shard_cap)
+
+    def _flush_trace(self):
+        if not self._trace:
+            return
+        keys, self._trace = self._trace, []
+        with open(self.trace_file, 'ab') as f:
+            array('Q', keys).tofile(f)
+
+    def _fault_in(self, keys):
+        # pull disk-resident entries into the in-memory layer
+        for k, (v, f) in self._store.get_many(keys).items():
+            sh = self._shard(k)
+            with sh.lock:
+                if k not in sh.cache:
+                    sh.cache[k] = v
+                    sh.lfu.add(k, f)
+                    sh.evict_to(self._shard_cap)
+
+    def _after_put(self):
+        if self.periodic_save and self._writer is None:
+            self._ensure_writer()
+        if self.backend == "sqlite" and len(self._dirty) >= self.flush_every:
+            if self.periodic_save: self._request_checkpoint()
+            else: self.flush()
+
+    def _write_snapshot(self, cache, freq):
+        # trim to the most used entries, then write-fsync-rename so a crash never leaves a torn file
+        if len(cache) > self.max_cache_size:
+            top = heapq.nlargest(self.max_cache_size, cache, key=lambda k: freq.get(k, 1))
+            cache = {k: cache[k] for k in top}
+        freq = {k: freq.get(k, 1) for k in cache}
+        data = {'version': 2, 'cache': cache, 'freq': freq}
+        tmp = self.cache_file.with_name(self.cache_file.name + '.tmp')
         try:
-            with gzip.open(tmp, 'wb') as f:
-                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(tmp, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                raw.flush()
+                os.fsync(raw.fileno())
             tmp.replace(self.cache_file)
+            try:
+                fd = os.open(self.cache_file.parent, os.O_RDONLY)
+                try: os.fsync(fd)
+                finally: os.close(fd)
+            except OSError:
+                pass
         finally:
             if tmp.exists():
                 tmp.unlink(missing_ok=True)
-        self.cache, self.freq = trimmed_cache, defaultdict(int, trimmed_freq)
-        self._reset_stats()
-        self._last_prune_time = time.time()
-        print(f"  ✓ saved {m} positions to {self.cache_file} (trimmed from {n})")
+        return cache, freq
 
-    # ---------- Internals ----------
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is not None or self._stop.is_set():
+                return
+            self._writer = threading.Thread(target=self._write_loop, name="DiskMemCache-writer", daemon=True)
+            self._writer.start()
+        # final flush runs before the interpreter joins non-daemon threads, like EnginePool;
+        # forked workers inherit the hook but not the writer, so only the owner may run it
+        pid = os.getpid()
+        threading._register_atexit(lambda: os.getpid() == pid and self.close())
+
+    def _request_checkpoint(self):
+        self._ensure_writer()
+        self._wake.set()
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"  ! background checkpoint failed: {e}")
+
+    def canonical(self, fen):
+        return canonical(fen, self.clock_horizon)
+
+    def _compute_key(self, fen):
+        return position_key(fen, self.clock_horizon)
 
-    def _key(self, fen, depth):
-        ck = (fen, int(depth))
-        kc = self._key_cache
-        if ck in kc:
-            kc.move_to_end(ck)
-            return kc[ck]
+    def _put(self, k, depth, value, freq=1):
+        # keep the deepest analysis; the depth travels inside the packed record
+        b = value if isinstance(value, bytes) else Eval.from_info(value, int(depth)).pack()
+        sh = self._shard(k)
+        with sh.lock:
+            old = sh.cache.get(k)
+            stored = old is None or depth_of(old) <= depth_of(b)
+            if stored:
+                sh.cache[k] = b
+            if old is None:
+                sh.lfu.add(k, freq)
+                sh.evict_to(self._shard_cap)
+            else:
+                sh.lfu.touch(k)
+        if stored:
+            self._last_put = next(self._put_seq)
+            if self._disk() is not None:
+                with self._dirty_lock:
+                    self._dirty[k] = b
+
+    @staticmethod
+    def _legacy_key(fen, depth):
+        # baseline caches keyed md5(full fen:depth); clocks included, so only exact FENs match
         m = hashlib.md5()
         m.update(fen.encode('utf-8'))
         m.update(b':')
         m.update(str(depth).encode('ascii'))
-        key = m.hexdigest()
-        kc[ck] = key
-        if len(kc) > self._key_cache_size:
-            kc.popitem(last=False)
-        return key
+        return m.hexdigest()
+
+    def _adopt_legacy(self, fen, depth, k, rows=None):
+        # rows: legacy rows already read from the store (migrate), instead of one query here
+        old = self._legacy_key(fen, depth)
+        osh = self._shard(old)
+        with osh.lock:
+            v, f = osh.cache.pop(old, None), osh.freq.get(old, 1)
+            if v is not None: osh.lfu.remove(old)
+        if v is None and self._store and (row := self._store.pop_legacy(old) if rows is None else rows.get(old)):
+            v, f = row
+        if v is None:
+            return None
+        self._put(k, depth, v, f)
+        with self._lock:
+            self._legacy_n = max(0, self._legacy_n - 1)
+        return v
+
+    def migrate(self, positions):
+        """Re-key legacy entries for the given (fen, depth) pairs; returns how many moved.
+
+        Until this has run, every miss also looks for a legacy entry (a query
+        per miss with the sqlite backend). Afterwards lookups skip that and only
+        migrate() adopts legacy entries, reading them from the store in bulk.
+        """
+        self._migrated = True
+        if not self._legacy_n:
+            return 0
+        positions = [(fen, depth, self._key(fen)) for fen, depth in positions]
+        if self._disk() is not None:
+            self._fault_in([k for _, _, k in positions if k not in self._shard(k).cache])
+        missing = [(fen, depth, k) for fen, depth, k in positions if k not in self._shard(k).cache]
+        rows = self._store.pop_legacy_many(self._legacy_key(f, d) for f, d, _ in missing) if self._store else None
+        return sum(self._adopt_legacy(fen, depth, k, rows) is not None for fen, depth, k in missing)
+
+    def _counts(self):
+        hits = misses = shallow = 0
+        for sh in self._shards:
+            with sh.lock:
+                hits, misses, shallow = hits + sh.hits, misses + sh.misses, shallow + sh.shallow
+        return hits, misses, shallow
 
     def _hit_rate(self):
-        t = self.hits + self.misses
-        return 100 * self.hits / t if t else 0
-
-    def _maybe_prune(self):
-        csize = len(self.cache)
-        if csize > self.max_cache_size * self._soft_cap_mult:
-            self._prune_in_memory()
-            if self.periodic_save:
-                self.save()
+        hits, misses, _ = self._counts()
+        t = hits + misses
+        return 100 * hits / t if t else 0
+
+    def _maybe_checkpoint(self):
+        if next(self._lookups) % self.check_interval != 0:
             return
-        if self.lookup_count % self.check_interval != 0:
+        if self.backend != "sqlite":
+            # a pickle checkpoint rewrites the whole snapshot, so it waits for the writer's flush_interval
+            if self.periodic_save: self._ensure_writer()
             return
-        if self._hit_rate() < self.prune_threshold or self.periodic_save:
-            self.save()
+        if self.periodic_save or self._hit_rate() < self.prune_threshold:
+            self._request_checkpoint()
 
     def _prune_in_memory(self):
-        n = len(self.cache)
-        if n <= self.max_cache_size:
+        # inserts already evict as they go; this only matters after max_cache_size shrinks
+        self._shard_cap = max(1, -(-self.max_cache_size // len(self._shards)))
+        n = len(self)
+        if all(len(sh.cache) <= self._shard_cap for sh in self._shards):
             return
         print(f"  - pruning in-memory: before {n} -> max {self.max_cache_size}")
-        items = ((self.freq.get(k, 1), k) for k in self.cache)
-        keep = {
-            k
-            for _, k in heapq.nlargest(
-                self.max_cache_size, items, key=lambda x: x[0])
-        }
-        for k in list(self.cache.keys()):
-            if k not in keep:
-                self.cache.pop(k, None)
-                self.freq.pop(k, None)
-        m = len(self.cache)
-        print(f"  ✓ pruned in-memory to {m} positions")
+        for sh in self._shards:
+            with sh.lock:
+                sh.evict_to(self._shard_cap)
         self._last_prune_time = time.time()
+        if self._legacy_n and self.backend != "sqlite":
+            self._legacy_n = sum(1 for sh in self._shards for k in list(sh.cache) if isinstance(k, str))
+        print(f"  ✓ pruned in-memory to {len(self)} positions")
 
     def force_prune(self):
         return self._prune_in_memory()
 
     def _reset_stats(self):
-        self.hits = self.misses = self.lookup_count = 0
+        for sh in self._shards:
+            with sh.lock:
+                sh.hits = sh.misses = sh.shallow = sh.evictions = 0
+        self._lookups = itertools.count(1)
 
     def stats(self):
-        return dict(cache_size=len(self.cache),
-                    freq_map_size=len(self.freq),
-                    hits=self.hits,
-                    misses=self.misses,
-                    hit_rate=self._hit_rate(),
-                    last_prune=self._last_prune_time)
\ No newline at end of file
+        hits, misses, shallow = self._counts()
+        return dict(cache_size=len(self),
+                    freq_map_size=sum(len(sh.freq) for sh in self._shards),
+                    hits=hits,
+                    misses=misses,
+                    hit_rate=100 * hits / (hits + misses) if hits + misses else 0,
+                    shallow_misses=shallow,
+                    evictions=sum(sh.evictions for sh in self._shards),
+                    legacy_keys=self._legacy_n,
+                    shards=len(self._shards),
+                    last_prune=self._last_prune_time)
+
+
+def load_trace(trace_file):
+    keys = array('Q')
+    with open(trace_file, 'rb') as f:
+        keys.frombytes(f.read())
+    return keys
+
+
+def simulate_policies(trace, capacity, policies=("lfu-da", "lfu", "lru")):
+    """Replay a lookup trace (keys, e.g. from load_trace) and return the hit rate % per policy."""
+    out = {}
+    for policy in policies:
+        hits = 0
+        if policy == "lru":
+            od = OrderedDict()
+            for k in trace:
+                if k in od:
+                    hits += 1
+                    od.move_to_end(k)
+                else:
+                    od[k] = None
+                    if len(od) > capacity: od.popitem(last=False)
+        else:
+            lfu = _Lfu(aging=policy == "lfu-da")
+            for k in trace:
+                if k in lfu.freq:
+                    hits += 1
+                    lfu.touch(k)
+                else:
+                    lfu.add(k)
+                    if len(lfu) > capacity: lfu.evict()
+        out[policy] = 100 * hits / len(trace) if len(trace) else 0
+    return out
@@ -0,0 +1,114 @@
+import os, queue, threading, time
+from contextlib import contextmanager
+import chess.engine
+
+
+class EngineWorker:
+    """One long-lived UCI engine process that restarts itself if it dies; cpus pins it (and its threads)."""
+
+    def __init__(self, path, options=None, cpus=None):
+        self.path, self.options, self.cpus = path, dict(options or {}), cpus
+        self.engine, self.restarts, self.positions = None, 0, 0
+        self.start()
+
+    def start(self):
+        # set in the child before exec, so every thread the engine later starts inherits it
+        pin = {"preexec_fn": lambda: os.sched_setaffinity(0, self.cpus)} if self.cpus else {}
+        self.engine = chess.engine.SimpleEngine.popen_uci(self.path, **pin)
+        opts = {k: v for k, v in self.options.items() if k in self.engine.options}
+        if opts: self.engine.configure(opts)
+
+    def restart(self):
+        self.close()
+        self.restarts += 1
+        self.start()
+
+    def analyse(self, board, limit, **kw):
+        try:
+            info = self.engine.analyse(board, limit, **kw)
+        except (chess.engine.EngineTerminatedError, chess.engine.EngineError):
+            self.restart()
+            info = self.engine.analyse(board, limit, **kw)
+        self.positions += 1
+        return info
+
+    def analysis(self, board, limit=None, **kw):
+        """Streaming search (python-chess analysis()); the caller stops it by leaving the context."""
+        try:
+            result = self.engine.analysis(board, limit, **kw)
+        except (chess.engine.EngineTerminatedError, chess.engine.EngineError):
+            self.restart()
+            result = self.engine.analysis(board, limit, **kw)
+        self.positions += 1
+        return result
+
+    def close(self):
+        if self.engine is None: return
+        try: self.engine.quit()
+        except Exception:
+            try: self.engine.close()
+            except Exception: pass
+        self.engine = None
+
+
+class EnginePool:
+    """Fixed-size pool of warm engines; callers check a worker out per game or position.
+
+    cpus: one CPU set per engine (ResourcePlan.Plan.cpus), e.g. to keep each inside a NUMA node.
+    """
+
+    def __init__(self, path, size=4, threads=1, hash_mb=64, options=None, cpus=None):
+        self.path, self.size = path, max(1, int(size))
+        self.options = {"Threads": threads, "Hash": hash_mb, **(options or {})}
+        self._idle, self._workers, self._lock = queue.Queue(), [], threading.Lock()
+        self._closed, self.games = False, 0
+        self.started = time.time()
+        for i in range(self.size):
+            w = EngineWorker(path, self.options, cpus[i % len(cpus)] if cpus else None)
+            self._workers.append(w)
+            self._idle.put(w)
+        # python-chess runs each engine on a non-daemon thread, which the interpreter joins
+        # *before* plain atexit hooks; register where concurrent.futures does so exit can't hang.
+        # Forked children run these hooks too, and must not touch the parent's engines.
+        pid = os.getpid()
+        threading._register_atexit(lambda: os.getpid() == pid and self.close())
+
+    @contextmanager
+    def engine(self):
+        if self._closed: raise RuntimeError("engine pool is closed")
+        w = self._idle.get()
+        try:
+            yield w
+        except (chess.engine.EngineTerminatedError, chess.engine.EngineError):
+            w.restart()
+            raise
+        finally:
+            self._idle.put(w)
+
+    def analyse(self, board, limit, **kw):
+        with self.engine() as w:
+            return w.analyse(board, limit, **kw)
+
+    def game_done(self, n=1):
+        with self._lock: self.games += n
+
+    def close(self):
+        if self._closed: return
+        self._closed = True
+        for w in self._workers: w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self):
+        elapsed = max(1e-9, time.time() - self.started)
+        positions = sum(w.positions for w in self._workers)
+        return dict(size=self.size,
+                    games=self.games,
+                    positions=positions,
+                    restarts=sum(w.restarts for w in self._workers),
+                    games_per_sec=self.games / elapsed,
+                    positions_per_sec=positions / elapsed)
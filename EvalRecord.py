@@ -0,0 +1,69 @@
+import struct
+from typing import NamedTuple
+import chess
+
+# cp:int16  mate:int8  move:uint16  depth:uint8  nodes:uint32  -> 10 bytes
+_FMT = struct.Struct("<hbHBI")
+SIZE = _FMT.size
+
+
+def encode_move(move):
+    if not move: return 0
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code):
+    if not code: return None
+    return chess.Move(code & 63, code >> 6 & 63, (code >> 12) or None)
+
+
+class Eval(NamedTuple):
+    """Fixed-width engine result, everything white-POV.
+
+    mate is 0 for a centipawn score, otherwise +(n+1) when white mates in n
+    and -(n+1) when white gets mated in n (so mate-in-0 keeps its sign).
+    """
+    cp: int = 0
+    mate: int = 0
+    move: int = 0
+    depth: int = 0
+    nodes: int = 0
+
+    @classmethod
+    def from_info(cls, info, depth=0):
+        if isinstance(info, cls): return info
+        sc, cp, mate = info.get("score"), 0, 0
+        if sc is not None:
+            sc = sc.white()
+            if sc.is_mate():
+                n = min(126, abs(sc.mate()))
+                mate = n + 1 if sc.score(mate_score=100_000) > 0 else -(n + 1)
+            else:
+                cp = max(-32768, min(32767, sc.score()))
+        pv = info.get("pv") or [None]
+        return cls(cp, mate, encode_move(pv[0]), min(255, info.get("depth") or depth),
+                   min(0xFFFFFFFF, info.get("nodes") or 0))
+
+    @classmethod
+    def unpack(cls, b):
+        return cls._make(_FMT.unpack(b))
+
+    def pack(self):
+        return _FMT.pack(*self)
+
+    def white_score(self, mate_score=None):
+        """Same numbers as PovScore.white().score(mate_score=...)."""
+        if not self.mate: return self.cp
+        if mate_score is None: return None
+        n = abs(self.mate) - 1
+        return mate_score - n if self.mate > 0 else -mate_score + n
+
+    def is_mate(self):
+        return self.mate != 0
+
+    def best_move(self):
+        return decode_move(self.move)
+
+
+def depth_of(b):
+    return b[5]  # byte offset of depth in _FMT
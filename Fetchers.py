@@ -1,13 +1,20 @@
-import random, httpx, chess.pgn, io, json, gzip, hashlib
+import asyncio, calendar, datetime, email.utils, os, random, time, httpx, json, gzip, hashlib
 from pathlib import Path
 from collections import deque
+from contextlib import aclosing
 
-_client = httpx.Client(
-    headers={
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"
-    })
+import PgnLite
+from GameStore import GameStore, game_key
+
+# point at a local stand-in server for testing, e.g. CHESS_API_BASE=http://127.0.0.1:8000/pub
+API_BASE = os.environ.get("CHESS_API_BASE", "https://api.chess.com/pub")
+CONCURRENCY = 8  # requests in flight
+RATE = 10.0  # requests/sec across the whole session
+_SETTLE = 6 * 3600  # a month's archive is final once fetched this long after it ended
+_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"}
 _cache_dir = Path(".cache/chess_api")
 _cache_dir.mkdir(parents=True, exist_ok=True)
+_games = GameStore(_cache_dir.parent / "games.db")
 
 
 def _cache(key, data=None):
@@ -15,133 +22,438 @@ def _cache(key, data=None):
     if data is None:
         return json.loads(gzip.decompress(
             f.read_bytes())) if f.exists() else None
-    f.write_bytes(gzip.compress(json.dumps(data).encode()))
+    tmp = f.with_suffix(".tmp")
+    tmp.write_bytes(gzip.compress(json.dumps(data).encode()))
+    tmp.replace(f)
 
 
-def _get_user_country(username):
+class RateLimiter:
+    """Token bucket shared by every request of a session; a 429 pauses it for Retry-After."""
+
+    def __init__(self, rate=RATE, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._tokens, self._t, self._paused_until = self.burst, time.monotonic(), 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+                self._t = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+def _backoff(res, attempt):
+    if res is not None and (v := res.headers.get("Retry-After")):
+        try: return max(0.0, float(v))
+        except ValueError:
+            try: return max(0.0, email.utils.parsedate_to_datetime(v).timestamp() - time.time())
+            except (TypeError, ValueError): pass
+    return min(60.0, 0.5 * 2**attempt) * (0.5 + random.random())
+
+
+class Session:
+    """Async API client: bounded concurrency, shared rate limit, retries with backoff.
+
+    429 and 5xx responses and transport errors are retried; anything else is
+    returned as-is so callers keep their `status_code != 200` checks.
+    """
+
+    def __init__(self, concurrency=CONCURRENCY, rate=RATE, retries=4, base=None, timeout=30.0):
+        self.base = (base or API_BASE).rstrip('/')
+        self.retries, self.requests = retries, 0
+        self.limiter = RateLimiter(rate)
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._client = httpx.AsyncClient(
+            headers=_HEADERS,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+
+    async def get(self, path, headers=None):
+        url, res = f"{self.base}/{path}", None
+        for attempt in range(self.retries + 1):
+            await self.limiter.acquire()
+            async with self._sem:
+                try:
+                    res = await self._client.get(url, headers=headers)
+                    self.requests += 1
+                except httpx.TransportError:
+                    res = None
+            if res is not None and res.status_code != 429 and res.status_code < 500:
+                return res
+            if attempt == self.retries: break
+            delay = _backoff(res, attempt)
+            if res is not None and res.status_code == 429: self.limiter.pause(delay)
+            await asyncio.sleep(delay)
+        return res
+
+
+def _ok(res):
+    return res is not None and res.status_code == 200
+
+
+def _validators(entry):
+    """Conditional-request headers for a cached response."""
+    h = {}
+    if entry and entry.get("etag"): h["If-None-Match"] = entry["etag"]
+    if entry and entry.get("modified"): h["If-Modified-Since"] = entry["modified"]
+    return h
+
+
+def _stamp(entry, res):
+    # a 304 may leave out either validator; keep the one we had rather than forget it
+    entry.update(etag=res.headers.get("ETag") or entry.get("etag"),
+                 modified=res.headers.get("Last-Modified") or entry.get("modified"), fetched=time.time())
+    return entry
+
+
+def _month_closed(year, month, fetched):
+    y, m = (int(year), int(month) + 1) if int(month) < 12 else (int(year) + 1, 1)
+    return fetched >= calendar.timegm((y, m, 1, 0, 0, 0)) + _SETTLE
+
+
+def _lists_this_month(archives):
+    # an archive list only grows when a new month starts, so it is final once it has this month
+    return bool(archives) and archives[-1].endswith(time.strftime("/%Y/%m", time.gmtime()))
+
+
+def _run(afn, *args, **kw):
+    """Run one async fetch on a fresh session, for synchronous callers."""
+
+    async def main():
+        async with Session() as s:
+            return await afn(s, *args, **kw)
+
+    return asyncio.run(main())
+
+
+async def _aget_user_country(s, username):
     key = f"user_country_{username}"
     if cached := _cache(key): return cached
-    res = _client.get(f"https://api.chess.com/pub/player/{username}")
+    res = await s.get(f"player/{username}")
     country = res.json().get(
-        "country", "").split('/')[-1] if res.status_code == 200 else None
+        "country", "").split('/')[-1] if _ok(res) else None
     _cache(key, country)
     return country
 
 
-def _fetch_user_archives(username, verbose=False):
+async def _afetch_user_archives(s, username, verbose=False, refresh=False):
     key = f"{username}_archives"
-    if cached := _cache(key):
+    cached = _cache(key)
+    if isinstance(cached, list): cached = {"archives": cached}  # pre-validator cache entry
+    if cached and (not refresh or _lists_this_month(cached["archives"])):
         if verbose: print(f"✓ cached archives: {username}")
-        return cached
+        return cached["archives"]
     if verbose: print(f"→ fetching archives: {username}")
-    res = _client.get(
-        f"https://api.chess.com/pub/player/{username}/games/archives")
-    if res.status_code != 200: return []
+    res = await s.get(f"player/{username}/games/archives", _validators(cached))
+    if cached and res is not None and res.status_code == 304:
+        _cache(key, _stamp(cached, res))
+        if verbose: print(f"✓ archives unchanged: {username}")
+        return cached["archives"]
+    if not _ok(res): return cached["archives"] if cached else []
     archives = res.json()["archives"]
-    _cache(key, archives)
+    _cache(key, _stamp({"archives": archives}, res))
     if verbose: print(f"✓ saved {len(archives)} archives")
     return archives
 
 
-def _fetch_archive_games(username, month, year, verbose=False):
+async def _afetch_archive_games(s, username, month, year, verbose=False, refresh=False):
+    """Sync one month of a user's games into the game store; returns how many new games it added.
+
+    A synced month is only asked for again on refresh, and then only while it
+    can still change, as a conditional request.
+    """
+    stamp = _games.month_stamp(username, year, month)
+    if stamp and (not refresh or _month_closed(year, month, stamp["fetched"])):
+        if verbose: print(f"✓ stored {year}/{month}")
+        return 0
     if verbose: print(f"→ downloading {year}/{month}")
-    res = _client.get(
-        f"https://api.chess.com/pub/player/{username}/games/{year}/{month}")
-    games = res.json()["games"] if res.status_code == 200 else []
-    if verbose: print(f"✓ got {len(games)} games")
-    return games
+    res = await s.get(f"player/{username}/games/{year}/{month}", _validators(stamp))
+    if stamp and res is not None and res.status_code == 304:
+        _games.set_month_stamp(username, year, month, _stamp(stamp, res))
+        if verbose: print(f"✓ {year}/{month} unchanged")
+        return 0
+    if not _ok(res): return 0
+    added = _store_games(res.json()["games"])
+    _games.set_month_stamp(username, year, month, _stamp({}, res))
+    if verbose: print(f"✓ got {added} new games")
+    return added
 
 
-def fetch_all_users_games(usernames, n=None, verbose=False):
-    if not isinstance(usernames, list): return []
-    h = hashlib.md5('_'.join(sorted(usernames)).encode()).hexdigest()
-    cache_key = f"users_{h}_{n}"
-    if cached := _cache(cache_key):
-        if verbose: print(f"✓ loaded {len(cached)} cached games")
-        return _parse_games(cached)
-    all_games = []
-    for username in usernames:
-        if not _get_user_country(username):
-            if verbose: print(f"✗ user not found: {username}")
-            continue
-        if verbose: print(f"→ {username}")
-        archives = _fetch_user_archives(username, verbose)
-        user_games = 0
-        for archive in archives:
-            year, month = archive.split('/')[-2:]
-            added = _fetch_archive_games(username, month, year, verbose)
-            all_games.extend(added)
-            user_games += len(added)
-            if n and len(all_games) >= n: break
-        if verbose: print(f"✓ {user_games} games from {username}")
-        if n and len(all_games) >= n: break
-    pgns = [g["pgn"].replace("\n", "\t") for g in all_games if "pgn" in g]
-    result = _parse_games(pgns)[:n]
-    _cache(cache_key, [g.accept(chess.pgn.StringExporter()) for g in result])
-    if verbose: print(f"✓ parsed {len(result)} games")
-    return result
+def _month_span(year, month):
+    # first and last second of a month, UTC
+    y, m = int(year), int(month)
+    return calendar.timegm((y, m, 1, 0, 0, 0)), calendar.timegm((y + m // 12, m % 12 + 1, 1, 0, 0, 0)) - 1
 
 
-def _fetch_country_players(country_code, verbose=False):
+def _epoch(t):
+    # date, datetime, epoch seconds or "YYYY-MM-DD" -> UTC epoch seconds
+    if t is None or isinstance(t, (int, float)): return t
+    if isinstance(t, str): t = datetime.date.fromisoformat(t)
+    if not isinstance(t, datetime.datetime): t = datetime.datetime(t.year, t.month, t.day)
+    return calendar.timegm(t.utctimetuple())
+
+
+class GameFilter:
+    """Which archived games to keep, applied as a game-store query on end_time and time_class.
+
+    time_class: "bullet"/"blitz"/"rapid"/"daily" or a collection of them.
+    since/until: date bounds on end_time; months entirely outside are never downloaded.
+    """
+
+    def __init__(self, time_class=None, since=None, until=None):
+        self.time_class = {time_class} if isinstance(time_class, str) else set(time_class or ())
+        self.since, self.until = _epoch(since), _epoch(until)
+
+    def month_ok(self, year, month):
+        start, end = _month_span(year, month)
+        return (self.since is None or end >= self.since) and (self.until is None or start <= self.until)
+
+    def clip(self, since, until):
+        """since/until narrowed to this filter's own bounds."""
+        return (since if self.since is None else max(since, self.since),
+                until if self.until is None else min(until, self.until))
+
+
+async def _afetch_user_games(s, username, limit=None, verbose=False, keep=None, newest_first=True, refresh=False):
+    """Up to `limit` of a user's games that pass `keep`, newest first by default, read from the game store.
+
+    Months are synced in that order only until the store holds enough of the
+    user's games from the months synced so far.
+    """
+    if not await _aget_user_country(s, username):
+        if verbose: print(f"✗ user not found: {username}")
+        return []
+    if verbose: print(f"→ {username}")
+    keep, span = keep or GameFilter(), None
+    archives = await _afetch_user_archives(s, username, verbose, refresh)
+    for archive in (reversed(archives) if newest_first else archives):
+        year, month = archive.split('/')[-2:]
+        if not keep.month_ok(year, month): continue
+        await _afetch_archive_games(s, username, month, year, verbose, refresh)
+        start, end = _month_span(year, month)
+        span = (min(start, span[0]), max(end, span[1])) if span else (start, end)
+        if limit and _games.count_for([username], keep.time_class, *keep.clip(*span)) >= limit: break
+    games = _games.games_for([username], limit, None, keep.time_class, *keep.clip(*span), newest_first) if span else []
+    if verbose: print(f"✓ {len(games)} games from {username}")
+    return games
+
+
+async def _afetch_country_players(s, country_code, verbose=False):
     key = f"country_{country_code}_players"
     if cached := _cache(key):
         if verbose:
             print(f"✓ cached {len(cached)} players from {country_code}")
         return cached
     if verbose: print(f"→ fetching players from {country_code}")
-    res = _client.get(
-        f"https://api.chess.com/pub/country/{country_code}/players")
-    players = res.json()["players"] if res.status_code == 200 else []
+    res = await s.get(f"country/{country_code}/players")
+    players = res.json()["players"] if _ok(res) else []
     _cache(key, players)
     if verbose: print(f"✓ found {len(players)} players")
     return players
 
 
-def spider_users(seed_user, n, m=50, o=3, verbose=False):
+def _get_user_country(username):
+    return _run(_aget_user_country, username)
+
+
+def _fetch_user_archives(username, verbose=False):
+    return _run(_afetch_user_archives, username, verbose)
+
+
+def _fetch_archive_games(username, month, year, verbose=False, refresh=False):
+    return _run(_afetch_archive_games, username, month, year, verbose, refresh)
+
+
+def _fetch_country_players(country_code, verbose=False):
+    return _run(_afetch_country_players, country_code, verbose)
+
+
+async def afetch_all_users_games(usernames, n=None, verbose=False, per_user=None, time_class=None, since=None,
+                                 until=None, newest_first=True, concurrency=CONCURRENCY, rate=RATE, refresh=False):
+    """Fetch several users' games concurrently; results come back in user order.
+
+    n caps the total and per_user caps each user; a user stops downloading
+    months as soon as their cap is met. time_class/since/until filter games
+    (see GameFilter) before they count towards either cap. Games are served
+    from the game store, so users whose months are already synced cost no
+    requests at all.
+
+    refresh=True re-syncs each user's archives, which only costs requests for
+    months that can still change.
+    """
+    if not isinstance(usernames, list): return []
+    keep = GameFilter(time_class, since, until)
+    limit = min(x for x in (n, per_user) if x) if n or per_user else None
+    all_games = []
+    async with Session(concurrency, rate) as s:
+        async with aclosing(_auser_games(s, usernames, limit, verbose, keep, newest_first, concurrency,
+                                         refresh, n)) as batches:
+            async for games in batches:
+                all_games.extend(games)
+                if n and len(all_games) >= n: break
+        if verbose: print(f"✓ {s.requests} requests")
+    if verbose: print(f"✓ loaded {len(all_games[:n])} games")
+    return all_games[:n]
+
+
+def fetch_all_users_games(usernames, n=None, verbose=False, **kw):
+    return asyncio.run(afetch_all_users_games(usernames, n, verbose, **kw))
+
+
+async def _auser_games(s, usernames, limit, verbose, keep, newest_first, concurrency, refresh=False, n=None):
+    """Each user's games, in user order, from a sliding window of users in flight.
+
+    With n set, another user is only started while the games collected so far,
+    plus what the users in flight return (at most `limit` each), fall short of n.
+    """
+    users, tasks, got = iter(usernames), deque(), 0
+
+    def short():
+        return not n or got + sum(len(t.result()) if t.done() and not t.exception() else limit
+                                  for t in tasks) < n
+
+    try:
+        while True:
+            while len(tasks) < 2 * concurrency and short() and (u := next(users, None)) is not None:
+                tasks.append(asyncio.ensure_future(_afetch_user_games(s, u, limit, verbose, keep, newest_first,
+                                                                         refresh)))
+            if not tasks: return
+            games = await tasks.popleft()
+            got += len(games)
+            yield games
+    finally:
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def stream_users_pgns(usernames, n=None, verbose=False, per_user=None, time_class=None, since=None, until=None,
+                      newest_first=True, concurrency=CONCURRENCY, rate=RATE):
+    """Yield each user's games as they arrive, in user order.
+
+    The games come from the game store with their moves already decoded; feed
+    them to Stockfish.analyze_games (ideally through Ingest.background so
+    downloading carries on while the engines work).
+    """
+    keep = GameFilter(time_class, since, until)
+    limit = min(x for x in (n, per_user) if x) if n or per_user else None
+
+    async def feed():
+        async with Session(concurrency, rate) as s:
+            async with aclosing(_auser_games(s, list(usernames), limit, verbose, keep, newest_first, concurrency,
+                                             n=n)) as batches:
+                async for games in batches:
+                    yield games
+
+    loop, agen, sent = asyncio.new_event_loop(), feed(), 0
+    try:
+        while not n or sent < n:
+            try: games = loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration: return
+            for g in games[:n - sent] if n else games:
+                yield g
+                sent += 1
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+async def _aopponents(s, username, m):
+    """Opponent usernames from a user's latest m games, read off the stored headers."""
+    games = await _afetch_user_games(s, username, m, keep=GameFilter())
+    return {p for g in games for p in (g.headers.get("White"), g.headers.get("Black"))
+            if p and p.lower() != username.lower()}
+
+
+async def aspider_users(seed_user, n, m=50, o=3, verbose=False, concurrency=CONCURRENCY, rate=RATE,
+                        checkpoint_every=15.0):
     """
     BFS spider from seed_user to collect n unique users via opponents in games.
+
+    Up to `concurrency` frontier users are expanded at once. The visited users
+    and the frontier are checkpointed to the cache every checkpoint_every
+    seconds (and on exit), so an interrupted crawl resumes where it stopped.
     """
     h = hashlib.md5(f"{seed_user}_{n}_{m}_{o}".encode()).hexdigest()
-    cache_key = f"spider_users_{h}"
+    cache_key, state_key = f"spider_users_{h}", f"spider_state_{h}"
     if cached := _cache(cache_key):
         if verbose: print(f"✓ loaded {len(cached)} cached users")
         return cached
-    if not _get_user_country(seed_user):
-        if verbose: print(f"✗ seed user not found: {seed_user}")
-        return []
-    users = {seed_user}
-    queue = deque([seed_user])
-    while len(users) < n and queue:
-        current = queue.popleft()
-        if verbose: print(f"→ crawling {current} ({len(users)}/{n})")
-        games = fetch_all_users_games([current], m, verbose)
-        opponents = {
-            opp
-            for game in games
-            for opp in (game.headers.get("White"), game.headers.get("Black"))
-            if opp and opp != current
-        }
-        candidates = opponents - users
-        if not candidates: continue
-        new_opps = random.sample(list(candidates), min(o, len(candidates)))
-        users.update(new_opps)
-        queue.extend(new_opps)
-        shuffled = list(queue)
-        random.shuffle(shuffled)
-        queue.clear()
-        queue.extend(shuffled)
-        if verbose: print(f"  added {len(new_opps)} new users")
+    async with Session(concurrency, rate) as s:
+        if state := _cache(state_key):
+            users, frontier = dict.fromkeys(state["users"]), state["frontier"]
+            if verbose: print(f"✓ resuming crawl: {len(users)} users, {len(frontier)} in frontier")
+        elif await _aget_user_country(s, seed_user):
+            users, frontier = {seed_user: None}, [seed_user]
+        else:
+            if verbose: print(f"✗ seed user not found: {seed_user}")
+            return []
+        pending, found, start, saved = {}, len(users), time.time(), time.time()
+
+        def checkpoint():
+            # users still being expanded go back on the frontier
+            _cache(state_key, {"users": list(users), "frontier": frontier + list(pending.values())})
+
+        try:
+            while len(users) < n and (frontier or pending):
+                while frontier and len(pending) < concurrency:
+                    # O(1) random pick: swap with the last element and pop
+                    i = random.randrange(len(frontier))
+                    frontier[i], frontier[-1] = frontier[-1], frontier[i]
+                    u = frontier.pop()
+                    pending[asyncio.ensure_future(_aopponents(s, u, m))] = u
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    pending.pop(t)
+                    candidates = [u for u in (t.result() if not t.exception() else ()) if u not in users]
+                    new_opps = random.sample(candidates, min(o, len(candidates)))
+                    users.update(dict.fromkeys(new_opps))
+                    frontier.extend(new_opps)
+                if time.time() - saved >= checkpoint_every:
+                    checkpoint()
+                    saved = time.time()
+                if verbose:
+                    per_min = 60 * (len(users) - found) / max(1e-9, time.time() - start)
+                    print(f"\r  {len(users)}/{n} users, {len(frontier)} in frontier, {per_min:.0f} users/min", end="")
+        finally:
+            for t in pending: t.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            checkpoint()
     result = list(users)[:n]
     _cache(cache_key, result)
-    if verbose: print(f"✓ collected {len(result)} users")
+    if verbose:
+        per_min = 60 * (len(users) - found) / max(1e-9, time.time() - start)
+        print(f"\n✓ collected {len(result)} users ({per_min:.0f} users/min)")
     return result
 
 
+def spider_users(seed_user, n, m=50, o=3, verbose=False, **kw):
+    return asyncio.run(aspider_users(seed_user, n, m, o, verbose, **kw))
+
+
 def fetch_random_games(n, m=50, o=3, verbose=False):
     cache_key = f"random_games_{n}_{m}_{o}"
     if cached := _cache(cache_key):
         if verbose: print(f"✓ loaded {len(cached)} cached games")
-        cached_games = _parse_games(cached)
+        cached_games = _load_games(cached)
         if len(cached_games) >= n: return cached_games
     countries = [
         'US', 'IN', 'RU', 'GB', 'DE', 'FR', 'CA', 'AU', 'BR', 'ES', 'IT', 'NL',
@@ -174,9 +486,8 @@ def fetch_random_games(n, m=50, o=3, verbose=False):
     if verbose: print()
     random.shuffle(all_games)
     filtered = [g for g in all_games[:n] if _valid_elo(g)]
-    if not cached or len(filtered) > len(_parse_games(cached)):
-        _cache(cache_key,
-               [g.accept(chess.pgn.StringExporter()) for g in filtered])
+    if not cached or len(filtered) > len(cached_games):
+        _cache(cache_key, [game_key(g) for g in filtered])
         if verbose: print(f"✓ cached {len(filtered)} games")
     if verbose:
         print(
@@ -210,6 +521,22 @@ def _valid_elo(game):
 def _parse_games(pgn_list):
     return [
         game for pgn in pgn_list
-        if (game := chess.pgn.read_game(io.StringIO(pgn.replace("\t", "\n")))
-            ) is not None
+        if (game := PgnLite.parse(pgn.replace("\t", "\n"))) is not None
     ]
+
+
+def _store_games(api_games):
+    """Put a month's API game dicts into the game store, parsing only PGNs it hasn't seen; returns how many."""
+    urls = [g.get("url") or hashlib.md5(g["pgn"].encode()).hexdigest() if "pgn" in g else None for g in api_games]
+    have, new = _games.has(u for u in urls if u), []
+    for u, g in zip(urls, api_games):
+        if u and u not in have and (game := PgnLite.parse(g["pgn"])) is not None:
+            game.headers["Link"] = u  # so game_key() finds the stored row again
+            new.append((u, game, g.get("end_time"), g.get("time_class")))
+    return _games.put_many(new)
+
+
+def _load_games(entries):
+    # saved results are game URLs now; older ones hold whole PGNs
+    if entries and entries[0].lstrip().startswith("["): return _parse_games(entries)
+    return _games.get(entries)
@@ -0,0 +1,45 @@
+from array import array
+from dataclasses import dataclass, field, fields, replace
+
+_ARRAYS = {"evals": "h", "piece_types": "b", "pawn_counts": "b", "best_moves": "b"}
+
+
+@dataclass(slots=True)
+class GameResult:
+    """One analysed game. Per-move data lives in typed arrays, 1-2 bytes a value.
+
+    evals: white-POV centipawns after each move, clamped to +-800.
+    piece_types, pawn_counts: piece moved and pawns on the board, per move.
+    best_moves: 1 where the tracked side played the engine's move.
+    color is chess.WHITE/BLACK for the tracked user, None when nobody is tracked.
+    """
+    evals: array = field(default_factory=lambda: array('h'))
+    piece_types: array = field(default_factory=lambda: array('b'))
+    pawn_counts: array = field(default_factory=lambda: array('b'))
+    color: bool | None = None
+    elo: int = 0
+    castle_turn: int | None = None
+    castle_side: str | None = None
+    won: bool | None = None
+    is_resignation: bool = False
+    best_moves: array = field(default_factory=lambda: array('b'))
+    hour: int | None = None
+    game_num: int | None = None
+
+    def __post_init__(self):
+        for name, code in _ARRAYS.items():
+            v = getattr(self, name)
+            if not (isinstance(v, array) and v.typecode == code):
+                setattr(self, name, array(code, v))
+
+    def numbered(self, game_num):
+        return replace(self, game_num=game_num)
+
+    def to_json(self):
+        return {f.name: getattr(self, f.name).tolist() if f.name in _ARRAYS else getattr(self, f.name)
+                for f in fields(self)}
+
+    @classmethod
+    def from_json(cls, d):
+        """Inverse of to_json."""
+        return cls(**d)
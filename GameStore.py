@@ -0,0 +1,174 @@
+import hashlib, json, sqlite3, threading
+from array import array
+from pathlib import Path
+import chess.pgn
+
+from EvalRecord import encode_move, decode_move
+from PgnLite import LiteGame
+
+_MAX_VARS = 900  # stay under SQLite's bound-parameter limit
+_COLUMNS = {"white": "White", "black": "Black", "white_elo": "WhiteElo", "black_elo": "BlackElo", "eco": "ECO",
+            "utc_date": "UTCDate", "utc_time": "UTCTime", "result": "Result", "time_control": "TimeControl"}
+_EXTRA = {"end_time": "INTEGER", "time_class": "TEXT"}  # from the API's JSON, not the PGN
+
+
+def _int(v):
+    try: return int(v)
+    except (TypeError, ValueError): return None
+
+
+def game_key(game):
+    """A game's identity: its Link header (the chess.com URL), else a hash of its PGN."""
+    return game.headers.get("Link") or hashlib.md5(
+        game.accept(chess.pgn.StringExporter(comments=False)).encode()).hexdigest()
+
+
+def pack_moves(game):
+    return array('H', (encode_move(m) for m in game.mainline_moves())).tobytes()
+
+
+def build_game(headers, moves):
+    """Rebuild a game from stored headers and packed moves, without any SAN parsing."""
+    codes = array('H')
+    codes.frombytes(moves)
+    return LiteGame(headers, moves=map(decode_move, codes))
+
+
+class GameStore:
+    """Single-file game store: one row per game keyed by URL, header columns indexed, moves 2 bytes each.
+
+    The months table records which (user, month) archives have been synced
+    and their HTTP validators, so a synced month is never downloaded again.
+    """
+
+    def __init__(self, path, mmap_mb=256):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", f"mmap_size={int(mmap_mb) << 20}",
+                       "temp_store=MEMORY"):
+            self._db.execute(f"PRAGMA {pragma}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS games(id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, "
+                         "white TEXT COLLATE NOCASE, black TEXT COLLATE NOCASE, white_elo INTEGER, "
+                         "black_elo INTEGER, eco TEXT, utc_date TEXT, utc_time TEXT, result TEXT, "
+                         "time_control TEXT, end_time INTEGER, time_class TEXT, headers TEXT NOT NULL, "
+                         "moves BLOB NOT NULL)")
+        have = {r[1] for r in self._db.execute("PRAGMA table_info(games)")}
+        for col, kind in _EXTRA.items():
+            if col not in have: self._db.execute(f"ALTER TABLE games ADD COLUMN {col} {kind}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS months(user TEXT COLLATE NOCASE, year INTEGER, "
+                         "month INTEGER, etag TEXT, modified TEXT, fetched REAL, PRIMARY KEY(user, year, month))")
+        for col in ("white", "black", "eco", "utc_date, utc_time", "end_time"):
+            name = col.split(",")[0]
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS games_{name} ON games({col})")
+
+    def put_many(self, games):
+        """games: chess.pgn.Game, (url, Game) or (url, Game, end_time, time_class).
+
+        A URL already stored is left as it is.
+        """
+        rows = []
+        for g in games:
+            url, g, *extra = g if isinstance(g, tuple) else (game_key(g), g)
+            h = g.headers
+            rows.append((url, h.get("White"), h.get("Black"), _int(h.get("WhiteElo")), _int(h.get("BlackElo")),
+                         h.get("ECO"), h.get("UTCDate"), h.get("UTCTime"), h.get("Result"), h.get("TimeControl"),
+                         *(extra + [None, None])[:2], json.dumps(dict(h)), pack_moves(g)))
+        if not rows: return 0
+        with self._lock:
+            before = self._db.total_changes
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO games(url, {', '.join([*_COLUMNS, *_EXTRA])}, headers, moves) "
+                f"VALUES({', '.join('?' * (len(_COLUMNS) + len(_EXTRA) + 3))})", rows)
+            self._db.execute("COMMIT")
+            return self._db.total_changes - before
+
+    def has(self, urls):
+        return set(self._select("url", "url", list(urls)))
+
+    def get(self, urls):
+        """Games for these URLs, in the order asked for; unknown URLs are skipped."""
+        urls = list(urls)
+        found = {u: (h, m) for u, h, m in self._select("url, headers, moves", "url", urls)}
+        return [build_game(json.loads(found[u][0]), found[u][1]) for u in urls if u in found]
+
+    def games_for(self, users, n=None, per_user=None, time_class=None, since=None, until=None, newest_first=True):
+        """Games involving any of `users`, at most per_user each and n overall, newest first by default.
+
+        time_class (one or a collection) and since/until (epoch seconds, inclusive)
+        filter on the API's end_time and time_class, so they only match synced games.
+        """
+        users = [u.lower() for u in users]
+        if not users: return []
+        where, args = self._where(users, time_class, since, until)
+        order = "DESC" if newest_first else "ASC"
+        q = (f"SELECT lower(white), lower(black), headers, moves FROM games WHERE {where} "
+             f"ORDER BY end_time {order}, utc_date {order}, utc_time {order}")
+        out, seen, want = [], dict.fromkeys(users, 0), set(users)
+        with self._lock:
+            for w, b, headers, moves in self._db.execute(q, args):
+                owners = [u for u in (w, b) if u in want]
+                if per_user and all(seen[u] >= per_user for u in owners): continue
+                for u in owners: seen[u] += 1
+                out.append(build_game(json.loads(headers), moves))
+                if n and len(out) >= n: break
+        return out
+
+    def count_for(self, users, time_class=None, since=None, until=None):
+        """How many games games_for would find with no caps."""
+        users = [u.lower() for u in users]
+        if not users: return 0
+        where, args = self._where(users, time_class, since, until)
+        with self._lock:
+            return self._db.execute(f"SELECT count(*) FROM games WHERE {where}", args).fetchone()[0]
+
+    def month_stamp(self, user, year, month):
+        """The validators a synced month was fetched with, or None if it never was."""
+        with self._lock:
+            row = self._db.execute("SELECT etag, modified, fetched FROM months WHERE user = ? AND year = ? "
+                                   "AND month = ?", (user, int(year), int(month))).fetchone()
+        return dict(zip(("etag", "modified", "fetched"), row)) if row else None
+
+    def set_month_stamp(self, user, year, month, stamp):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO months VALUES(?, ?, ?, ?, ?, ?)",
+                             (user, int(year), int(month), stamp.get("etag"), stamp.get("modified"),
+                              stamp["fetched"]))
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM games").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            try: self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error: pass
+            self._db.close()
+
+    @staticmethod
+    def _where(users, time_class, since, until):
+        # the two IN lists are answered from the white/black indexes
+        marks = ','.join('?' * len(users))
+        where, args = [f"(white IN ({marks}) OR black IN ({marks}))"], users + users
+        if time_class:
+            classes = [time_class] if isinstance(time_class, str) else list(time_class)
+            where.append(f"time_class IN ({','.join('?' * len(classes))})")
+            args += classes
+        if since is not None:
+            where.append("end_time >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("end_time <= ?")
+            args.append(until)
+        return " AND ".join(where), args
+
+    def _select(self, cols, key, values):
+        out = []
+        with self._lock:
+            for lo in range(0, len(values), _MAX_VARS):
+                chunk = values[lo:lo + _MAX_VARS]
+                q = f"SELECT {cols} FROM games WHERE {key} IN ({','.join('?' * len(chunk))})"
+                out.extend(self._db.execute(q, chunk))
+        return [r[0] for r in out] if ',' not in cols else out
@@ -0,0 +1,86 @@
+import os, queue, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+_DONE = object()
+
+
+def chunked(items, size):
+    it = iter(items)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def background(items, maxsize=64):
+    """Iterate `items` on a daemon thread, staying at most maxsize items ahead of the consumer.
+
+    Exceptions are re-raised in the consumer; abandoning the generator stops the thread.
+    """
+    q, stop = queue.Queue(maxsize), threading.Event()
+
+    def put(x):
+        while not stop.is_set():
+            try: return q.put(x, timeout=0.1)
+            except queue.Full: pass
+
+    def run():
+        it, err = iter(items), None
+        try:
+            for x in it:
+                put((x, None))
+                if stop.is_set(): break
+        except BaseException as e:
+            err = e
+        finally:
+            if hasattr(it, "close"): it.close()
+            put((_DONE, err))
+
+    threading.Thread(target=run, daemon=True, name="ingest").start()
+    try:
+        while True:
+            x, err = q.get()
+            if x is _DONE:
+                if err: raise err
+                return
+            yield x
+    finally:
+        stop.set()
+
+
+def _apply(fn, chunk):
+    out = []
+    for x in chunk:
+        try: out.append(fn(x))
+        except Exception: out.append(None)
+    return out
+
+
+def pmap(fn, items, procs=None, chunk=32, inflight=None):
+    """Ordered, lazy fn(x) over `items` on a process pool; None where fn raised.
+
+    Items are pulled and submitted chunk by chunk with at most `inflight` chunks
+    outstanding, so a slow consumer holds back the source instead of buffering it.
+    Short inputs (a single chunk) are mapped in-process.
+    """
+    it = chunked(items, chunk)
+    first = next(it, [])
+    if len(first) < chunk:
+        return iter(_apply(fn, first))
+    procs = procs or min(4, max(1, (os.cpu_count() or 2) // 4))
+    ex = ProcessPoolExecutor(procs)
+    # submit now, from the calling thread: workers fork before any consumer threads exist
+    pending = deque([ex.submit(_apply, fn, first)])
+
+    def gen():
+        try:
+            for c in it:
+                pending.append(ex.submit(_apply, fn, c))
+                if len(pending) >= (inflight or 2 * procs):
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+    return gen()
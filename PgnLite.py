@@ -0,0 +1,133 @@
+import re, sys, time
+from functools import lru_cache
+from io import StringIO
+import chess, chess.pgn
+
+_TAG = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$', re.M)
+_TOKEN = re.compile(r"\{[^}]*\}|;[^\n]*|[()]|[^\s(){};]+")
+_BODY = re.compile(r"^(?![ \t]*\[)", re.M)
+_MOVE_NUMBER = re.compile(r"^\d+\.+")
+_RESULTS = {"1-0", "0-1", "1/2-1/2", "*"}
+_PLAIN = {"standard", "chess960", "chess 960", "fischerandom", "from position"}
+
+
+def split(pgn):
+    """(header text, movetext) of one game; the movetext starts at the first line that isn't a tag."""
+    pgn = pgn.lstrip()
+    if not pgn.startswith("["): return "", pgn
+    m = _BODY.search(pgn)
+    return (pgn[:m.start()], pgn[m.start():].lstrip()) if m else (pgn, "")
+
+
+def _tags(head):
+    return {k: v.replace('\\"', '"').replace("\\\\", "\\") for k, v in _TAG.findall(head)}
+
+
+def read_headers(pgn):
+    """Tag pairs only, no board or move work at all."""
+    return _tags(split(pgn)[0])
+
+
+def _chess960(headers):
+    return "960" in headers.get("Variant", "") or "fischer" in headers.get("Variant", "").lower()
+
+
+@lru_cache(maxsize=8192)
+def decode_moves(movetext, fen=None, chess960=False):
+    """Mainline moves of a movetext in one pass, skipping comments, NAGs and variations.
+
+    Cached, so every consumer of the same game shares one decode. Stops at the
+    first illegal move, as chess.pgn.read_game does.
+    """
+    board = chess.Board(fen, chess960=chess960) if fen else chess.Board(chess960=chess960)
+    moves, depth = [], 0
+    for tok in _TOKEN.findall(movetext):
+        c = tok[0]
+        if c in "{;$": continue
+        if c == "(": depth += 1; continue
+        if c == ")": depth -= 1; continue
+        if depth: continue
+        if tok in _RESULTS: break
+        if c.isdigit() and not (tok := _MOVE_NUMBER.sub("", tok)): continue
+        try:
+            move = board.parse_san(tok.rstrip("!?"))
+        except ValueError:
+            break
+        moves.append(move)
+        board.push(move)
+    return tuple(moves)
+
+
+class LiteGame:
+    """Headers plus the mainline, decoded on first use; stands in for chess.pgn.Game
+    wherever only headers, board() and mainline_moves() are read."""
+    __slots__ = ("headers", "_movetext", "_moves")
+
+    def __init__(self, headers, movetext="", moves=None):
+        self.headers, self._movetext = headers, movetext
+        self._moves = tuple(moves) if moves is not None else None
+
+    def board(self):
+        fen = self.headers.get("FEN")
+        return chess.Board(fen, chess960=_chess960(self.headers)) if fen else chess.Board()
+
+    def mainline_moves(self):
+        if self._moves is None:
+            self._moves = decode_moves(self._movetext, self.headers.get("FEN"), _chess960(self.headers))
+        return self._moves
+
+    def game(self):
+        """The full chess.pgn.Game (no comments), for anything that needs a node tree."""
+        game = chess.pgn.Game(self.headers)
+        node = game
+        for move in self.mainline_moves():
+            node = node.add_variation(move)
+        return game
+
+    def accept(self, visitor):
+        return self.game().accept(visitor)
+
+
+def parse(pgn):
+    """PGN text -> LiteGame (chess.pgn.Game for unusual variants); games pass through."""
+    if not isinstance(pgn, str): return pgn
+    head, movetext = split(pgn)
+    if not head and not movetext.strip(): return None
+    headers = _tags(head)
+    if headers.get("Variant", "Standard").lower() not in _PLAIN:
+        return chess.pgn.read_game(StringIO(pgn))
+    return LiteGame(headers, movetext)
+
+
+def headers_of(pgn):
+    return read_headers(pgn) if isinstance(pgn, str) else pgn.headers
+
+
+def benchmark(pgns, repeat=3):
+    """Parse throughput in games/sec: full read_game vs header scan vs one-pass move decode."""
+    pgns = list(pgns)
+
+    def rate(fn):
+        best = float("inf")
+        for _ in range(repeat):
+            decode_moves.cache_clear()
+            t = time.perf_counter()
+            for p in pgns: fn(p)
+            best = min(best, time.perf_counter() - t)
+        return len(pgns) / max(best, 1e-9)
+
+    out = dict(read_game=rate(lambda p: list(chess.pgn.read_game(StringIO(p)).mainline_moves())),
+               read_game_headers=rate(lambda p: chess.pgn.read_headers(StringIO(p))),
+               read_headers=rate(read_headers),
+               lite_moves=rate(lambda p: parse(p).mainline_moves()))
+    for p in pgns: parse(p).mainline_moves()
+    t = time.perf_counter()
+    for p in pgns: parse(p).mainline_moves()
+    out["lite_moves_cached"] = len(pgns) / max(time.perf_counter() - t, 1e-9)
+    for k, v in out.items(): print(f"  {k:>18}: {v:10.0f} games/sec")
+    return out
+
+
+if __name__ == "__main__":
+    text = open(sys.argv[1], encoding="utf-8").read()
+    benchmark([g for g in re.split(r"(?m)^(?=\[Event )", text) if g.strip()])
@@ -0,0 +1,88 @@
+import sqlite3, threading
+from pathlib import Path
+
+from EvalRecord import depth_of
+
+_MAX_VARS = 900  # stay under SQLite's bound-parameter limit
+
+
+def _s64(k):
+    # cache keys are unsigned 64-bit; SQLite integers are signed
+    return k - (1 << 64) if k >= 1 << 63 else k
+
+
+def _u64(k):
+    return k + (1 << 64) if k < 0 else k
+
+
+class SqliteStore:
+    """Single-file, memory-mapped position store: one row per position, upserts keep the deepest."""
+
+    def __init__(self, path, mmap_mb=1024):
+        self.path = Path(path)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", f"mmap_size={int(mmap_mb) << 20}",
+                       "temp_store=MEMORY"):
+            self._db.execute(f"PRAGMA {pragma}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS positions("
+                         "k INTEGER PRIMARY KEY, v BLOB NOT NULL, d INTEGER NOT NULL, f INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS legacy("
+                         "k TEXT PRIMARY KEY, v BLOB NOT NULL, f INTEGER NOT NULL)")
+
+    def get_many(self, keys):
+        out, keys = {}, [_s64(k) for k in keys]
+        with self._lock:
+            for lo in range(0, len(keys), _MAX_VARS):
+                chunk = keys[lo:lo + _MAX_VARS]
+                q = f"SELECT k, v, f FROM positions WHERE k IN ({','.join('?' * len(chunk))})"
+                out.update((_u64(k), (v, f)) for k, v, f in self._db.execute(q, chunk))
+        return out
+
+    def put_many(self, items):
+        """items: (key, packed record, freq); a shallower record never replaces a deeper one."""
+        rows = [(_s64(k), v, depth_of(v), f) for k, v, f in items]
+        if not rows: return
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO positions(k, v, d, f) VALUES(?, ?, ?, ?) ON CONFLICT(k) DO UPDATE SET "
+                "v=CASE WHEN excluded.d >= d THEN excluded.v ELSE v END, "
+                "d=max(d, excluded.d), f=max(f, excluded.f)", rows)
+            self._db.execute("COMMIT")
+
+    def pop_legacy(self, k):
+        with self._lock:
+            row = self._db.execute("SELECT v, f FROM legacy WHERE k=?", (k,)).fetchone()
+            if row: self._db.execute("DELETE FROM legacy WHERE k=?", (k,))
+        return row
+
+    def pop_legacy_many(self, keys):
+        """{key: (packed record, freq)} for those of `keys` in the legacy table, deleting them."""
+        out, keys = {}, list(dict.fromkeys(keys))
+        with self._lock:
+            self._db.execute("BEGIN")
+            for lo in range(0, len(keys), _MAX_VARS):
+                chunk = keys[lo:lo + _MAX_VARS]
+                marks = ','.join('?' * len(chunk))
+                out.update((k, (v, f)) for k, v, f in
+                           self._db.execute(f"SELECT k, v, f FROM legacy WHERE k IN ({marks})", chunk))
+                self._db.execute(f"DELETE FROM legacy WHERE k IN ({marks})", chunk)
+            self._db.execute("COMMIT")
+        return out
+
+    def put_legacy(self, items):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT OR REPLACE INTO legacy(k, v, f) VALUES(?, ?, ?)", items)
+            self._db.execute("COMMIT")
+
+    def count(self, table="positions"):
+        with self._lock:
+            return self._db.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            try: self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error: pass
+            self._db.close()
@@ -1,4 +1,11 @@
 # ProgressLogging.py
-def progress(i, tot, label="games"):
-    print(f"\r  {i}/{tot} {label}", end="", flush=True)
+import time
+
+
+def progress(i, tot, label="games", start=None, positions=None):
+    rate = ""
+    if start is not None and (elapsed := time.time() - start) > 0:
+        rate = f"  {i/elapsed:.2f} {label}/sec"
+        if positions is not None: rate += f", {positions/elapsed:.2f} pos/sec"
+    print(f"\r  {i}/{tot} {label}{rate}", end="", flush=True)
     if i == tot: print()
@@ -0,0 +1,116 @@
+import threading
+from array import array
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+import chess
+
+import PgnLite
+from DiskMemCache import canonical, position_key
+from EvalRecord import Eval, SIZE, encode_move
+
+OPENINGS_FILE = ".cache/openings.bin"
+
+
+class OpeningTable:
+    """Evals of the opening positions the corpus keeps reaching, lifted out of the position cache.
+
+    A book: entries are served whatever depth they were built at, so build it
+    from the deepest cache available. On disk it is the sorted 8-byte position
+    keys (DiskMemCache.position_key) followed by one 10-byte Eval record per key.
+    """
+
+    def __init__(self, path=OPENINGS_FILE, evals=None):
+        self.path, self._evals = Path(path), evals if evals is not None else {}
+        if evals is None and self.path.exists(): self.load()
+
+    def __len__(self):
+        return len(self._evals)
+
+    def get(self, fen):
+        b = self._evals.get(position_key(fen))
+        return Eval.unpack(b) if b else None
+
+    def load(self):
+        data = self.path.read_bytes()
+        keys = array('Q')
+        keys.frombytes(data[:len(data) // (8 + SIZE) * 8])
+        recs = data[len(keys) * 8:]
+        self._evals = {k: recs[i * SIZE:(i + 1) * SIZE] for i, k in enumerate(keys)}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = sorted(self._evals)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_bytes(array('Q', keys).tobytes() + b"".join(self._evals[k] for k in keys))
+        tmp.replace(self.path)
+
+    @classmethod
+    def build(cls, pgns, cache, plies=16, min_games=20, depth=0, path=OPENINGS_FILE):
+        """Positions among the first `plies` of at least min_games games, with a cached eval >= depth."""
+        seen, fens = Counter(), {}
+        for pgn in pgns:
+            game = PgnLite.parse(pgn)
+            if not game: continue
+            board, mine = game.board(), set()
+            for move in islice(game.mainline_moves(), plies):
+                fen = board.fen()
+                mine.add(canon := canonical(fen))
+                fens.setdefault(canon, fen)
+                board.push(move)
+            seen.update(mine)
+        table = cls(path, {})
+        hits, _ = cache.get_many((fens[c], depth) for c, n in seen.items() if n >= min_games)
+        for (fen, _), ev in hits.items():
+            table._evals[position_key(fen)] = ev.pack()
+        table.save()
+        print(f"  {len(table)} opening positions (of {len(seen)} seen in the first {plies} plies)")
+        return table
+
+
+class Resolver:
+    """Answers positions that don't need a search, counting hits per kind.
+
+    resolve() gives (kind, answer): an Eval for terminal, insufficient-material
+    and book positions, the only legal move for a forced one (its eval is the
+    child's, which the caller has or will have), or (None, None) for the engine.
+    Callers count() what they actually used, plus their cache and engine work.
+    """
+
+    KINDS = ("terminal", "insufficient", "forced", "book", "cache", "engine")
+
+    def __init__(self, openings=None):
+        self.openings = openings if openings is not None else OpeningTable()
+        self.hits, self._lock = Counter(), threading.Lock()
+
+    def resolve(self, board, depth=0):
+        moves = list(islice(board.legal_moves, 2))
+        if not moves:
+            # mate-in-0 keeps its sign: the side to move is the one mated
+            return "terminal", Eval(mate=-1 if board.turn == chess.WHITE else 1, depth=depth) \
+                if board.is_check() else Eval(depth=depth)
+        if board.is_insufficient_material():
+            return "insufficient", Eval(depth=depth)
+        if len(moves) == 1:
+            return "forced", moves[0]
+        if self.openings and (ev := self.openings.get(board.fen())):
+            return "book", ev
+        return None, None
+
+    def count(self, kind, n=1):
+        if kind and n:
+            with self._lock: self.hits[kind] += n
+
+    def stats(self):
+        with self._lock: return {k: self.hits[k] for k in self.KINDS}
+
+    def reset(self):
+        with self._lock: self.hits.clear()
+
+
+def through_forced(child, move, turn):
+    """The eval of a forced position from its child's: same score, one more move to mate for the mover."""
+    mate = child.mate
+    if mate > 0 and turn == chess.WHITE: mate += 1
+    elif mate < 0 and turn == chess.BLACK: mate -= 1
+    return Eval(child.cp, mate, encode_move(move), child.depth, 0)
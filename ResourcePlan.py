@@ -0,0 +1,140 @@
+import math, os, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+import chess, chess.engine
+
+_CGROUP = Path("/sys/fs/cgroup")
+_ENGINE_MB = 48      # an engine process besides its hash: NNUE weights, stacks, pawn tables
+_RESERVE_MB = 1024   # left for Python, the caches and the OS
+
+
+def _read(path):
+    try: return Path(path).read_text().strip()
+    except OSError: return None
+
+
+def _cpulist(text):
+    """"0-3,8,10-11" -> {0, 1, 2, 3, 8, 10, 11}"""
+    cpus = set()
+    for part in filter(None, (text or "").split(",")):
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+
+def affinity():
+    try: return set(os.sched_getaffinity(0))
+    except AttributeError: return set(range(os.cpu_count() or 1))
+
+
+def cpu_quota():
+    """CPUs the cgroup lets us use (cpu.max, or v1 cfs quota/period); None when unlimited."""
+    if (v2 := _read(_CGROUP / "cpu.max")) and not v2.startswith("max"):
+        quota, period = map(int, v2.split())
+        return quota / period
+    quota, period = _read(_CGROUP / "cpu/cpu.cfs_quota_us"), _read(_CGROUP / "cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def available_cpus():
+    n, quota = len(affinity()), cpu_quota()
+    return max(1, min(n, math.floor(quota)) if quota else n)
+
+
+def available_memory_mb():
+    """MemAvailable, capped by the cgroup limit less what the cgroup already uses."""
+    mem = None
+    for line in (_read("/proc/meminfo") or "").splitlines():
+        if line.startswith("MemAvailable:"):
+            mem = int(line.split()[1]) // 1024
+    for limit, used in (("memory.max", "memory.current"),
+                        ("memory/memory.limit_in_bytes", "memory/memory.usage_in_bytes")):
+        lim = _read(_CGROUP / limit)
+        if lim and lim.isdigit() and int(lim) < 1 << 60:
+            free = (int(lim) - int(_read(_CGROUP / used) or 0)) // (1 << 20)
+            mem = free if mem is None else min(mem, free)
+            break
+    return mem if mem is not None else 4096
+
+
+def numa_nodes():
+    """The CPUs we may run on, grouped by NUMA node (one group on non-NUMA machines)."""
+    mine, nodes = affinity(), []
+    for d in sorted(Path("/sys/devices/system/node").glob("node[0-9]*"), key=lambda p: int(p.name[4:])):
+        if cpus := _cpulist(_read(d / "cpulist")) & mine:
+            nodes.append(sorted(cpus))
+    return nodes or [sorted(mine)]
+
+
+@dataclass(frozen=True)
+class Plan:
+    """How many engines, with how many Threads and how much Hash each, and where they run.
+
+    cpus holds one CPU set per engine (None: leave placement to the OS); with
+    several NUMA nodes each engine is pinned inside one node, and an engine
+    that needs more than one node gets NumaPolicy=hardware so Stockfish
+    spreads its own threads and hash across them.
+    """
+    engines: int
+    threads: int
+    hash_mb: int
+    numa_policy: str | None = None
+    cpus: tuple = None
+
+    def options(self):
+        return {"NumaPolicy": self.numa_policy} if self.numa_policy else {}
+
+
+def plan(engines=None, threads=None, hash_mb=None, cpus=None, memory_mb=None, reserve_mb=_RESERVE_MB):
+    """Fill in whatever of engines x Threads x Hash isn't given, from the cores and memory we actually have.
+
+    Many positions are searched independently, and Stockfish's threads scale
+    sublinearly, so the default is one thread per engine and one engine per
+    usable core. Hash is what memory allows, a power of two in 16..256 MB; if
+    even 16 MB apiece doesn't fit, fewer engines.
+    """
+    cpus = cpus or available_cpus()
+    memory_mb = (memory_mb or available_memory_mb()) - reserve_mb
+    threads = max(1, int(threads or 1))
+    engines = max(1, int(engines or cpus // threads))
+    if hash_mb is None:
+        each = memory_mb / engines - _ENGINE_MB
+        if each < 16:
+            engines = max(1, min(engines, int(memory_mb // (16 + _ENGINE_MB))))
+            each = 16
+        hash_mb = 1 << max(4, min(8, int(math.log2(max(16, each)))))
+    nodes = numa_nodes()
+    if len(nodes) < 2:
+        return Plan(engines, threads, int(hash_mb))
+    if threads > max(map(len, nodes)):
+        return Plan(engines, threads, int(hash_mb), "hardware")
+    # round-robin engines over nodes, each confined to its node
+    placed = tuple(tuple(nodes[i % len(nodes)]) for i in range(engines))
+    return Plan(engines, threads, int(hash_mb), "none", placed)
+
+
+def measure(stockfish_path, fens, depth=10, configs=None, hash_mb=None):
+    """Positions/sec for each (engines, threads) config on the same FENs, fastest first.
+
+    The default configs step the engine count up to the usable cores at one
+    thread, then trade engines for threads at full load.
+    """
+    from EnginePool import EnginePool
+    cpus, fens = available_cpus(), list(fens)
+    if configs is None:
+        steps = sorted({1, 2, 4, 8, 16, 32, 64} & set(range(1, cpus + 1)) | {cpus})
+        configs = [(e, 1) for e in steps] + [(cpus // t, t) for t in (2, 4) if cpus // t >= 1 and t <= cpus]
+    limit, curve = chess.engine.Limit(depth=depth), []
+    for engines, threads in configs:
+        p = plan(engines, threads, hash_mb)
+        with EnginePool(stockfish_path, p.engines, p.threads, p.hash_mb, p.options(), p.cpus) as pool:
+            t = time.perf_counter()
+            with ThreadPoolExecutor(pool.size) as ex:
+                list(ex.map(lambda f: pool.analyse(chess.Board(f), limit), fens))
+            rate = len(fens) / max(1e-9, time.perf_counter() - t)
+        curve.append(dict(engines=p.engines, threads=p.threads, hash_mb=p.hash_mb, positions_per_sec=rate))
+        print(f"  {p.engines:>3} engines x {p.threads} threads, {p.hash_mb:>4} MB hash: {rate:9.1f} pos/sec")
+    return sorted(curve, key=lambda c: -c["positions_per_sec"])
@@ -0,0 +1,110 @@
+import hashlib, json, os
+from pathlib import Path
+
+import PgnLite
+from GameResult import GameResult
+from GameStore import game_key
+
+
+def game_id(pgn):
+    """Stable id for a game: its Link header (the chess.com URL), else a hash of the PGN."""
+    if isinstance(pgn, str):
+        return PgnLite.read_headers(pgn).get("Link") or hashlib.md5(pgn.strip().encode()).hexdigest()
+    return game_key(pgn)
+
+
+def in_shard(gid, shard):
+    """shard=(i, k): does this game belong to the i-th of k disjoint slices of the corpus?"""
+    i, k = shard
+    return int(hashlib.md5(gid.encode()).hexdigest(), 16) % k == i
+
+
+class RunManifest:
+    """Append-only JSONL of finished games, one line per game keyed by (game id, depth, engine, users, track_time).
+
+    Each result is written and flushed as soon as it is known, so a crashed run
+    loses at most the game in flight; a torn last line is ignored on reload.
+    Lines for another depth, engine, user set or track_time are kept in the
+    file but not reused.
+    """
+
+    def __init__(self, path, depth, engine, users=None, track_time=False, fsync_every=64):
+        self.path, self.depth, self.engine = Path(path), int(depth), engine
+        self.users, self.track_time = sorted({u.lower() for u in users or ()}), bool(track_time)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.results, self._fsync_every, self._unsynced = {}, fsync_every, 0
+        torn, mine = False, self._key(self._record(None, None))[1:]
+        if self.path.exists():
+            for rec in self._read(self.path):
+                if self._key(rec)[1:] == mine:
+                    self.results[rec["game"]] = GameResult.from_json(rec["result"])
+            with open(self.path, "rb") as f:
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+        self._f = open(self.path, "a", encoding="utf-8")
+        # finish a line torn by a crash, or the next record would be glued onto it and lost
+        if torn: self._f.write("\n")
+
+    def matches(self, depth, engine, users=None, track_time=False):
+        """Was this manifest opened for the same run parameters?"""
+        return (self.depth, self.engine, self.users, self.track_time) == \
+            (int(depth), engine, sorted({u.lower() for u in users or ()}), bool(track_time))
+
+    def _record(self, gid, result):
+        return {"game": gid, "depth": self.depth, "engine": self.engine, "users": self.users,
+                "track_time": self.track_time, "result": result}
+
+    @staticmethod
+    def _key(rec):
+        return rec["game"], rec["depth"], rec["engine"], tuple(rec["users"]), rec["track_time"]
+
+    def __contains__(self, gid):
+        return gid in self.results
+
+    def __len__(self):
+        return len(self.results)
+
+    def get(self, gid):
+        return self.results.get(gid)
+
+    def append(self, gid, result):
+        if result is None: return
+        self.results[gid] = result
+        self._f.write(json.dumps(self._record(gid, result.to_json())) + "\n")
+        self._f.flush()
+        self._unsynced += 1
+        if self._unsynced >= self._fsync_every:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._f.closed: return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _read(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try: yield json.loads(line)
+                except json.JSONDecodeError: continue
+
+    @classmethod
+    def merge(cls, paths, out):
+        """Combine per-shard manifests into one, first record per (game, depth, engine, users, track_time) wins."""
+        seen = set()
+        with open(out, "w", encoding="utf-8") as f:
+            for p in paths:
+                for rec in cls._read(p):
+                    if (key := cls._key(rec)) not in seen:
+                        seen.add(key)
+                        f.write(json.dumps(rec) + "\n")
+        return len(seen)
@@ -0,0 +1,69 @@
+import threading, time
+from dataclasses import dataclass, field
+import chess.engine
+
+from EvalRecord import Eval
+
+
+@dataclass(slots=True)
+class Tally:
+    """Nodes and seconds spent so far, for one game or a whole run."""
+    nodes: int = 0
+    seconds: float = 0.0
+
+    def over(self, nodes, seconds):
+        return bool(nodes and self.nodes >= nodes) or bool(seconds and self.seconds >= seconds)
+
+
+@dataclass(slots=True)
+class SearchBudget:
+    """Adaptive per-position search: deepen from the floor depth, stop as soon as deeper won't change much.
+
+    A search past the floor depth stops when the score is beyond +-clamp (the
+    metrics clamp it there anyway) or when the last `stable` depths agree within
+    `margin` centipawns; only positions whose eval keeps swinging run on to
+    max_depth. nodes caps each position; game_* and run_* cap the totals, after
+    which positions get the floor depth only. The Eval keeps the depth actually
+    reached, so cache entries stay honest about what they are.
+    """
+    max_depth: int = 20
+    stable: int = 3
+    margin: int = 15
+    clamp: int = 800
+    nodes: int | None = None
+    game_nodes: int | None = None
+    game_seconds: float | None = None
+    run_nodes: int | None = None
+    run_seconds: float | None = None
+    spent: Tally = field(default_factory=Tally, init=False, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def tag(self):
+        """What a result depends on, for run manifests: the stopping rule, not the caps."""
+        return f"adaptive<={self.max_depth}/{self.stable}x{self.margin}cp/{self.clamp}/{self.nodes or '-'}n"
+
+    def search(self, engine, board, depth, game=None, tally=None):
+        """One position on `engine` (anything with python-chess's analysis()); returns an Eval."""
+        with self._lock: capped = self.spent.over(self.run_nodes, self.run_seconds)
+        capped = capped or (tally is not None and tally.over(self.game_nodes, self.game_seconds))
+        limit = chess.engine.Limit(depth=depth if capped else max(depth, self.max_depth), nodes=self.nodes)
+        best, scores, t = None, [], time.perf_counter()
+        with engine.analysis(board, limit, game=game) as analysis:
+            for info in analysis:
+                if "score" not in info or "depth" not in info or info.get("lowerbound") or info.get("upperbound"):
+                    continue
+                best = info
+                scores.append(info["score"].white().score(mate_score=100_000))
+                if info["depth"] < depth: continue
+                if abs(scores[-1]) >= self.clamp: break
+                last = scores[-self.stable:]
+                if len(last) == self.stable and max(last) - min(last) <= self.margin: break
+            best = best or analysis.info
+        elapsed = time.perf_counter() - t
+        ev = Eval.from_info(best, 0)
+        for tl in (tally, self.spent):
+            if tl is None: continue
+            with self._lock:
+                tl.nodes += ev.nodes
+                tl.seconds += elapsed
+        return ev
@@ -1,101 +1,484 @@
-import chess, chess.engine
-from io import StringIO
+import os, time
+import chess, chess.engine, chess.pgn
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from collections import defaultdict
+from collections import Counter, defaultdict
+from collections.abc import Sequence
+from functools import lru_cache, partial
 
+import CalcHelpers
+import Ingest
+import PgnLite
+import ResourcePlan
 from DiskMemCache import DiskMemCache
+from EnginePool import EnginePool
+from EvalRecord import Eval
+from GameResult import GameResult
 from ProgressLogging import progress
+from Resolvers import Resolver, through_forced
+from SearchBudget import Tally
+from WorkQueue import Coordinator
+from RunManifest import RunManifest, game_id, in_shard
 
 _pcache = DiskMemCache()
+_pool = None
+_resolver = Resolver()
+
+
+def _game_plan(pgn, users=None, track_time=False, game_num=None):
+    """Everything about a game that doesn't need the engine, plus the FEN before each move."""
+    game = PgnLite.parse(pgn)
+    if not game: return None
+
+    white, black = game.headers.get("White", "").lower(), game.headers.get("Black", "").lower()
+    user_list = [u.lower() for u in (users or [])]
+    color = chess.WHITE if white in user_list else chess.BLACK if black in user_list else None
+
+    result = game.headers.get("Result", "*")
+    won = None
+    if result in ["1-0", "0-1"]:
+        won = (result == "1-0") == (color == chess.WHITE) if color else (result == "1-0")
+
+    hour = None
+    if track_time and (d := game.headers.get("UTCDate")) and (t := game.headers.get("UTCTime")):
+        try:
+            hour = datetime.strptime(f"{d} {t}", "%Y.%m.%d %H:%M:%S").replace(
+                tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("America/Denver")).hour
+        except:
+            pass
+
+    board, fens, moves, piece_types, pawn_counts = game.board(), [], [], [], []
+    castle_turn, castle_side = None, None
+    for move_index, move in enumerate(game.mainline_moves(), 1):
+        fens.append(board.fen())
+        moves.append(move)
+        piece_types.append(board.piece_type_at(move.from_square))
+        pawn_counts.append(sum(len(board.pieces(chess.PAWN, s)) for s in [chess.WHITE, chess.BLACK]))
+
+        if not castle_turn and board.is_castling(move) and board.turn == (color or board.turn):
+            castle_turn, castle_side = move_index, "K" if move.to_square > move.from_square else "Q"
+
+        board.push(move)
+
+    return dict(board=game.board(), fens=fens, moves=moves, piece_types=piece_types, pawn_counts=pawn_counts,
+                color=color, elo=int(game.headers.get("WhiteElo", 0) or game.headers.get("BlackElo", 0)),
+                castle_turn=castle_turn, castle_side=castle_side, won=won,
+                is_resignation=result in ["1-0", "0-1"] and not board.is_checkmate(),
+                hour=hour, game_num=game_num, stamp=_stamp(game.headers, user_list))
+
+
+def _assemble(plan, infos):
+    """Build the GameResult from a plan and one Eval per FEN."""
+    color, evals, best_moves = plan["color"], [], []
+    for move_index, (move, info) in enumerate(zip(plan["moves"], infos), 1):
+        evals.append(max(-800, min(800, info.white_score(mate_score=1e4) or 0)))
+        if (not color or move_index % 2 != color) and (pv := info.best_move()):
+            best_moves.append(move == pv)
+    return GameResult(evals, plan["piece_types"], plan["pawn_counts"], color, plan["elo"],
+                      plan["castle_turn"], plan["castle_side"], plan["won"], plan["is_resignation"],
+                      best_moves, plan["hour"], plan["game_num"])
+
+
+def _walk(plan, order="forward"):
+    """(ply, board before that ply's move) in analysis order; the board carries the game's move stack.
+
+    "backward" starts from the last position and pops towards the first, the way
+    annotators run it: each search finds the hash already holding the lines the
+    game actually went on to play.
+    """
+    board, moves = plan["board"], plan["moves"]
+    if order == "forward":
+        for k, move in enumerate(moves):
+            yield k, board
+            board.push(move)
+    elif order == "backward":
+        for move in moves[:-1]: board.push(move)
+        for k in reversed(range(len(moves))):
+            yield k, board
+            if k: board.pop()
+    else:
+        raise ValueError(f"unknown order {order!r}")
 
 
 def evaluate_single_game(pgn, stockfish_path, depth_limit, users=None, 
-                         track_time=False, game_num=None):
+                         track_time=False, game_num=None, pool=None, order="forward", budget=None):
     try:
-        game = chess.pgn.read_game(StringIO(pgn)) if isinstance(pgn, str) else pgn
-        if not game: return None
-
-        white, black = game.headers.get("White", "").lower(), game.headers.get("Black", "").lower()
-        user_list = [u.lower() for u in (users or [])]
-        color = chess.WHITE if white in user_list else chess.BLACK if black in user_list else None
-
-        result = game.headers.get("Result", "*")
-        won = None
-        if result in ["1-0", "0-1"]:
-            won = (result == "1-0") == (color == chess.WHITE) if color else (result == "1-0")
-
-        hour = None
-        if track_time and (d := game.headers.get("UTCDate")) and (t := game.headers.get("UTCTime")):
-            try:
-                hour = datetime.strptime(f"{d} {t}", "%Y.%m.%d %H:%M:%S").replace(
-                    tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("America/Denver")).hour
-            except:
-                pass
-
-        board, evals, piece_types, pawn_counts, best_moves = game.board(), [], [], [], []
-        castle_turn, castle_side = None, None
-
-        with chess.engine.SimpleEngine.popen_uci(stockfish_path) as engine:
-            for move_index, move in enumerate(game.mainline_moves(), 1):
-                fen = board.fen()
-                info = _pcache.get(fen, depth_limit.depth)
-                if not info:
-                    info = engine.analyse(board, depth_limit)
-                    _pcache.put(fen, depth_limit.depth, info)
-
-                evals.append(max(-800, min(800, info["score"].white().score(mate_score=1e4) or 0)))
-                piece_types.append(board.piece_type_at(move.from_square))
-                pawn_counts.append(sum(len(board.pieces(chess.PAWN, s)) for s in [chess.WHITE, chess.BLACK]))
-
-                if not castle_turn and board.is_castling(move) and board.turn == (color or board.turn):
-                    castle_turn, castle_side = move_index, "K" if move.to_square > move.from_square else "Q"
-
-                if (not color or move_index % 2 != color) and (pv := info.get("pv", [None])[0]):
-                    best_moves.append(move == pv)
-
-                board.push(move)
-
-        is_resignation = result in ["1-0", "0-1"] and not board.is_checkmate()
-
-        return (evals, piece_types, pawn_counts, color,
-                int(game.headers.get("WhiteElo", 0) or game.headers.get("BlackElo", 0)),
-                castle_turn, castle_side, won, is_resignation, best_moves, hour, game_num)
+        plan = _game_plan(pgn, users, track_time, game_num)
+        if not plan: return None
+
+        # one session per game: ucinewgame once at its start, then the hash carries over ply to ply
+        n, depth = len(plan["fens"]), depth_limit.depth
+        infos, forced, session, tally = [None] * n, {}, object(), Tally()
+        with pool.engine() if pool else _one_shot(stockfish_path) as engine:
+            for k, board in _walk(plan, order):
+                kind, answer = _resolver.resolve(board, depth)
+                if kind == "forced" and k + 1 < n:
+                    forced[k] = (answer, board.turn)
+                    continue
+                if kind != "forced" and answer:
+                    infos[k] = answer
+                elif info := _pcache.get(plan["fens"][k], depth):
+                    infos[k], kind = info, "cache"
+                else:
+                    info = budget.search(engine, board, depth, session, tally) if budget else \
+                        Eval.from_info(engine.analyse(board, depth_limit, game=session), depth)
+                    _pcache.put(plan["fens"][k], depth, info)
+                    infos[k], kind = info, "engine"
+                _resolver.count(kind)
+        # a forced ply takes the eval of the ply after it, so fill them from the end
+        for k in sorted(forced, reverse=True):
+            infos[k] = through_forced(infos[k + 1], *forced[k])
+        _resolver.count("forced", len(forced))
+
+        if pool: pool.game_done()
+        return _assemble(plan, infos)
     except:
         return None
 
 
-def assign_game_numbers(pgns):
+def benchmark_order(pgns, stockfish_path, depth, orders=("forward", "backward"), threads=1, hash_mb=None):
+    """Nodes searched and wall time per game for each analysis order, same depth, no position cache.
+
+    Every game starts from a fresh hash (ucinewgame), so the orders differ only
+    in how much one ply's search leaves behind for the next.
+    """
+    plans = [p for p in map(_game_plan, pgns) if p and p["moves"]]
+    limit, out = chess.engine.Limit(depth=depth), {}
+    p = ResourcePlan.plan(1, threads, hash_mb)
+    with EnginePool(stockfish_path, 1, p.threads, p.hash_mb, p.options()) as pool:
+        for order in orders:
+            nodes, t = 0, time.perf_counter()
+            for plan in plans:
+                session = object()
+                for _, board in _walk(dict(plan, board=plan["board"].copy()), order):
+                    nodes += pool.analyse(board, limit, game=session).get("nodes") or 0
+            elapsed = time.perf_counter() - t
+            out[order] = dict(nodes_per_game=nodes / len(plans), sec_per_game=elapsed / len(plans))
+            print(f"  {order:>8}: {out[order]['nodes_per_game']:12.0f} nodes/game  "
+                  f"{out[order]['sec_per_game']:8.3f} s/game")
+    return out
+
+
+def assign_game_numbers(pgns, users=None):
+    users, stamps = [u.lower() for u in (users or [])], []
+    for pgn in pgns:
+        try: h = PgnLite.headers_of(pgn)
+        except Exception: h = {}
+        stamps.append(_stamp(h, users))
+    return _number_games(stamps)
+
+
+def _stamp(headers, users):
+    """(UTCDate, UTCTime, tracked user playing or None); White wins ties, as for `color` in _game_plan."""
+    white, black = headers.get("White", "").lower(), headers.get("Black", "").lower()
+    owner = white if white in users else black if black in users else None
+    return headers.get("UTCDate"), headers.get("UTCTime"), owner
+
+
+def _number_games(stamps):
+    """(UTCDate, UTCTime, user) per game -> {index: n-th game of that local day for that user}.
+
+    Each tracked user is numbered among their own games only; games with no
+    tracked player are numbered among themselves.
+    """
     grouped = defaultdict(list)
-    for idx, pgn in enumerate(pgns):
+    for idx, stamp in enumerate(stamps):
         try:
-            g = chess.pgn.read_game(StringIO(pgn)) if isinstance(pgn, str) else pgn
-            if not g or not (d := g.headers.get("UTCDate")) or not (t := g.headers.get("UTCTime")):
+            d, t, owner = stamp or (None, None, None)
+            if not d or not t:
                 continue
             local = datetime.strptime(f"{d} {t}", "%Y.%m.%d %H:%M:%S").replace(
                 tzinfo=ZoneInfo("UTC")).astimezone(ZoneInfo("America/Denver"))
-            grouped[local.date()].append((local, idx))
+            grouped[owner, local.date()].append((local, idx))
         except:
             continue
     return {i: n for day, games in grouped.items() for n, (_, i) in enumerate(sorted(games), 1)}
 
 
-def analyze_games(pgns, stockfish_path, depth, users=None, track_time=False):
-    total, game_nums = len(pgns), assign_game_numbers(pgns) if users else {}
-    with ThreadPoolExecutor() as executor:
+def _one_shot(stockfish_path):
+    return chess.engine.SimpleEngine.popen_uci(stockfish_path)
+
+
+@lru_cache(maxsize=None)
+def engine_id(stockfish_path):
+    """The engine's UCI `id name`, e.g. "Stockfish 17"; part of every manifest key."""
+    with _one_shot(stockfish_path) as engine:
+        return engine.id.get("name") or os.path.basename(stockfish_path)
+
+
+@lru_cache(maxsize=None)
+def _resources(workers=None, threads=None, hash_mb=None):
+    # planned once per explicit knobs: MemAvailable drops as the pool's own hash is
+    # allocated, and re-planning from it would shrink the plan and rebuild the pool
+    return ResourcePlan.plan(workers, threads, hash_mb)
+
+
+def get_pool(stockfish_path, workers=None, threads=None, hash_mb=None):
+    """The shared pool, (re)built when the engine or the workers/threads/hash_mb asked for change.
+
+    None fills in from ResourcePlan, once per combination of the explicit ones.
+    """
+    global _pool
+    p = _resources(workers, threads, hash_mb)
+    if (_pool is None or _pool.path != stockfish_path or _pool._closed or _pool.size != p.engines
+            or _pool.options.get("Threads") != p.threads or _pool.options.get("Hash") != p.hash_mb):
+        if _pool: _pool.close()
+        print(f"  {p.engines} engines x {p.threads} threads, {p.hash_mb} MB hash each"
+              + (f", NumaPolicy={p.numa_policy}" if p.numa_policy else ""))
+        _pool = EnginePool(stockfish_path, p.engines, p.threads, p.hash_mb, p.options(), p.cpus)
+    return _pool
+
+
+def close_pool():
+    global _pool
+    if _pool: _pool.close()
+    _pool = None
+
+
+def _try_analyse(pool, fen, limit, budget=None):
+    try:
+        if budget:
+            with pool.engine() as engine:
+                return budget.search(engine, chess.Board(fen), limit.depth)
+        return Eval.from_info(pool.analyse(chess.Board(fen), limit), limit.depth)
+    except Exception:
+        return None
+
+
+def _eval_threads(todo, stockfish_path, depth, workers, threads, hash_mb, batch_size, budget=None):
+    pool, limit = get_pool(stockfish_path, workers, threads, hash_mb), chess.engine.Limit(depth=depth)
+    with ThreadPoolExecutor(pool.size) as executor:
+        for lo in range(0, len(todo), batch_size):
+            chunk = todo[lo:lo + batch_size]
+            yield from zip(chunk, executor.map(lambda f: _try_analyse(pool, f, limit, budget), chunk))
+
+
+def _eval_processes(todo, stockfish_path, depth, workers, threads, hash_mb, batch_size):
+    p = _resources(workers, threads, hash_mb)
+    chunksize = max(1, min(32, len(todo) // (p.engines * 8)))
+    for i, info in CalcHelpers.iter_eval_fens(todo, stockfish_path, depth, p.threads, p.engines, p.hash_mb, chunksize,
+                                              plan=p):
+        yield todo[i], info
+
+
+def _analyse_fens(todo, stockfish_path, depth, workers, threads, hash_mb, batch_size, engine, budget=None):
+    """Yield (fen, info) as the engine finishes each FEN, writing results to the cache in batches.
+
+    A budget runs on the thread pool: its run caps are shared state. engine may
+    also be a WorkQueue.Coordinator, which farms the FENs out to remote workers.
+    """
+    if not todo: return
+    if engine == "auto": engine = "processes" if ResourcePlan.available_cpus() > 2 else "threads"
+    if budget:
+        evaluator = partial(_eval_threads, budget=budget)
+    elif isinstance(engine, Coordinator):
+        evaluator = lambda todo, _path, depth, *_: engine.evaluate(todo, depth)
+    else:
+        evaluator = _eval_processes if engine == "processes" else _eval_threads
+    start, done = time.time(), []
+    for n, (fen, info) in enumerate(evaluator(todo, stockfish_path, depth, workers, threads, hash_mb, batch_size), 1):
+        if info: done.append((fen, depth, info))
+        if n % batch_size == 0 or n == len(todo):
+            _pcache.put_many(done)
+            done = []
+            progress(n, len(todo), "positions", start=start)
+        yield fen, info
+
+
+def _pre_engine(counts, depth):
+    """Answer what the resolvers can: ({fen: Eval}, {fen: (child fen, move, turn)} for forced FENs)."""
+    infos, forced = {}, {}
+    for fen in counts:
+        board = chess.Board(fen)
+        kind, answer = _resolver.resolve(board, depth)
+        if kind == "forced":
+            turn = board.turn
+            board.push(answer)
+            # only worth it when the child is being evaluated anyway
+            if (child := board.fen()) not in counts: continue
+            forced[fen] = (child, answer, turn)
+        elif answer:
+            infos[fen] = answer
+        else:
+            continue
+        _resolver.count(kind)
+    return infos, forced
+
+
+def _through_forced(infos, forced):
+    for fen in forced:
+        chain = [fen]
+        while chain[-1] not in infos and len(chain) <= len(forced): chain.append(forced[chain[-1]][0])
+        if chain[-1] not in infos: infos[chain[-1]] = None  # forced moves round a repetition
+        for f in reversed(chain[:-1]):
+            child, move, turn = forced[f]
+            infos[f] = infos[child] and through_forced(infos[child], move, turn)
+
+
+def _resolve(counts, stockfish_path, depth, workers, threads, hash_mb, batch_size, engine, budget=None):
+    """An Eval per FEN in `counts`: resolvers first, then cache hits, then the misses (most frequent first)."""
+    infos, forced = _pre_engine(counts, depth)
+    _pcache.migrate((fen, depth) for fen in counts if fen not in infos and fen not in forced)
+    hits, misses = _pcache.get_many((fen, depth) for fen in counts if fen not in infos and fen not in forced)
+    infos.update((fen, v) for (fen, _), v in hits.items())
+    _resolver.count("cache", len(hits))
+    # FENs differing only in move clocks are one cache entry; analyse one representative each
+    same = defaultdict(list)
+    for fen, _ in misses: same[_pcache.canonical(fen)].append(fen)
+    todo = sorted((fens[0] for fens in same.values()),
+                  key=lambda f: -sum(counts[x] for x in same[_pcache.canonical(f)]))
+    print(f"  {sum(counts.values())} positions, {len(counts)} unique, {len(todo)} to analyse")
+    _resolver.count("engine", len(todo))
+    for fen, info in _analyse_fens(todo, stockfish_path, depth, workers, threads, hash_mb, batch_size, engine,
+                                   budget):
+        for twin in same[_pcache.canonical(fen)]: infos[twin] = info
+    _through_forced(infos, forced)
+    return infos
+
+
+def analyze_positions(pgns, stockfish_path, depth, users=None, track_time=False, workers=None, threads=None,
+                      hash_mb=None, batch_size=256, engine="auto", wave=None, parse_procs=None, on_result=None,
+                      budget=None):
+    """Dedupe every position in the corpus, analyse only uncached ones (most frequent first).
+
+    pgns can be any iterable, e.g. Fetchers.stream_users_pgns(...). Games are
+    parsed on a process pool in the background and analysed `wave` games at a
+    time, so the engines start on the first games while later ones are still
+    arriving. A list is a single wave unless `wave` says otherwise.
+    on_result(i, result) is called for each game as soon as its wave is done.
+    """
+    _resolver.reset()  # resolver_stats() describes this run only
+    wave = wave or (len(pgns) or 1 if isinstance(pgns, Sequence) else 256)
+    plan = partial(_game_plan, users=users, track_time=track_time)
+    plans = Ingest.background(Ingest.pmap(plan, pgns, parse_procs), maxsize=2 * wave)
+    results, stamps, positions, t0 = [], [], 0, time.time()
+    for chunk in Ingest.chunked(plans, wave):
+        counts = Counter(fen for p in chunk if p for fen in p["fens"])
+        infos = _resolve(counts, stockfish_path, depth, workers, threads, hash_mb, batch_size, engine, budget)
+        for p in chunk:
+            try: results.append(_assemble(p, [infos[f] for f in p["fens"]]) if p else None)
+            except Exception: results.append(None)
+            stamps.append(p and p["stamp"])
+            if on_result: on_result(len(results) - 1, results[-1])
+        positions += sum(counts.values())
+
+    if users:
+        nums = _number_games(stamps)
+        results = [r.numbered(nums.get(i)) if r else r for i, r in enumerate(results)]
+    if (elapsed := time.time() - t0) > 0:
+        print(f"  {len(results)/elapsed:.2f} games/sec, {positions/elapsed:.2f} pos/sec")
+    return results
+
+
+def upgrade_cache(pgns, stockfish_path, depth, workers=None, threads=None, hash_mb=None,
+                  batch_size=256, engine="auto"):
+    """Re-analyse only the corpus positions already cached below `depth`; unseen ones are left alone."""
+    fens = {}
+    for pgn in pgns:
+        try: plan = _game_plan(pgn)
+        except Exception: plan = None
+        for fen in plan["fens"] if plan else []: fens.setdefault(_pcache.canonical(fen), fen)
+    todo = _pcache.shallower(fens.values(), depth)
+    print(f"  {len(fens)} unique positions, {len(todo)} cached below depth {depth}")
+    for _ in _analyse_fens(todo, stockfish_path, depth, workers, threads, hash_mb, batch_size, engine): pass
+    return len(todo)
+
+
+def analyze_games(pgns, stockfish_path, depth, users=None, track_time=False, workers=None, threads=None,
+                  hash_mb=None, batch=True, engine="auto", manifest=None, shard=None, order="forward",
+                  budget=None):
+    """One GameResult per game (None where a game couldn't be analysed).
+
+    manifest: a RunManifest or a JSONL path. Each finished game is appended
+    as it completes, keyed by game id, depth, engine version, users and
+    track_time; games already in it are not analysed again, so a crashed run
+    picks up where it stopped.
+    shard=(i, k) analyses only the i-th of k disjoint slices of the corpus
+    (the rest come back None unless the manifest has them), so k machines can
+    split a run and combine their manifests with RunManifest.merge.
+    order ("forward" or "backward") is the ply order within each game when
+    batch=False; see _walk and benchmark_order.
+    budget: a SearchBudget, making `depth` the floor each position is searched
+    to, deepened only while its score keeps moving (see SearchBudget).
+    workers, threads and hash_mb left as None are planned from the usable
+    cores, cgroup quota and memory (ResourcePlan.plan).
+    engine="threads"/"processes"/"auto", or a WorkQueue.Coordinator to spread
+    the batch path's engine work over worker machines.
+    """
+    _resolver.reset()
+    if manifest is None and shard is None:
+        return _analyze(pgns, stockfish_path, depth, users, track_time, workers, threads, hash_mb, batch, engine,
+                        order=order, budget=budget)
+    own = manifest is not None and not isinstance(manifest, RunManifest)
+    tag = engine_id(stockfish_path) + (f" {budget.tag()}" if budget else "")
+    if own: manifest = RunManifest(manifest, depth, tag, users, track_time)
+    elif manifest is not None and not manifest.matches(depth, tag, users, track_time):
+        raise ValueError(f"manifest {manifest.path} was opened for another depth, engine, users or track_time")
+    ids, stamps, todo, fresh, tracked = [], [], [], {}, [u.lower() for u in (users or [])]
+
+    def pending():
+        for i, pgn in enumerate(pgns):
+            ids.append(gid := game_id(pgn))
+            h = PgnLite.headers_of(pgn)
+            stamps.append(_stamp(h, tracked))
+            if (shard and not in_shard(gid, shard)) or (manifest is not None and gid in manifest): continue
+            todo.append(i)
+            yield pgn
+
+    def finished(j, r):
+        fresh[todo[j]] = r
+        if manifest is not None: manifest.append(ids[todo[j]], r)
+
+    try:
+        src = list(pending()) if isinstance(pgns, Sequence) else pending()
+        if manifest is not None: print(f"  {len(manifest)} games already in {manifest.path}")
+        _analyze(src, stockfish_path, depth, users, track_time, workers, threads, hash_mb, batch, engine, finished,
+                 order, budget)
+    finally:
+        if own: manifest.close()
+    results = [fresh[i] if i in fresh else manifest.get(gid) if manifest is not None else None
+               for i, gid in enumerate(ids)]
+    if users:
+        nums = _number_games(stamps)
+        results = [r.numbered(nums.get(i)) if r else r for i, r in enumerate(results)]
+    return results
+
+
+def _analyze(pgns, stockfish_path, depth, users, track_time, workers, threads, hash_mb, batch, engine,
+             on_result=None, order="forward", budget=None):
+    if batch:
+        return analyze_positions(pgns, stockfish_path, depth, users, track_time, workers, threads, hash_mb,
+                                 engine=engine, on_result=on_result, budget=budget)
+    pgns = list(pgns)
+    total, game_nums = len(pgns), assign_game_numbers(pgns, users) if users else {}
+    pool = get_pool(stockfish_path, workers, threads, hash_mb)
+    start, positions = time.time(), 0
+    with ThreadPoolExecutor(pool.size) as executor:
         futures = {
             executor.submit(evaluate_single_game, pgn, stockfish_path,
-                          chess.engine.Limit(depth=depth), users, track_time, game_nums.get(i)): i
+                          chess.engine.Limit(depth=depth), users, track_time, game_nums.get(i), pool, order,
+                          budget): i
             for i, pgn in enumerate(pgns)
         }
         results = [None] * total
         for completed, future in enumerate(as_completed(futures), 1):
-            results[futures[future]] = future.result()
-            progress(completed, total)
+            results[futures[future]] = r = future.result()
+            if on_result: on_result(futures[future], r)
+            positions += len(r.evals) if r else 0
+            progress(completed, total, start=start, positions=positions)
     return results
 
 
+def pool_stats():
+    return _pool.stats() if _pool else {}
+
+
+def resolver_stats():
+    """Positions answered per route in the last run: terminal/insufficient/forced/book (no engine), cache, engine."""
+    return _resolver.stats()
+
+
 def load_cache():
     _pcache.load()
 
@@ -0,0 +1,255 @@
+import os, socket, sqlite3, subprocess, sys, threading, time
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from xmlrpc.client import Binary, ServerProxy
+from xmlrpc.server import SimpleXMLRPCServer
+import chess, chess.engine
+
+from EvalRecord import Eval
+
+PENDING, LEASED, DONE, FAILED = range(4)
+
+
+class WorkQueue:
+    """Durable queue of (fen, depth) jobs in one SQLite file; results are packed 10-byte Evals.
+
+    Workers lease batches for lease_seconds and renew() the jobs still in hand
+    while they work. A lease that runs out goes back to pending (a dead worker
+    just stops renewing), and a job that has been leased
+    max_attempts times without a result is marked failed rather than retried forever.
+    Everything survives a coordinator restart: finished rows are never redone.
+    """
+
+    def __init__(self, path, lease_seconds=120.0, max_attempts=3):
+        self.path, self.lease_seconds, self.max_attempts = Path(path), float(lease_seconds), int(max_attempts)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL"):
+            self._db.execute(f"PRAGMA {pragma}")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs(id INTEGER PRIMARY KEY, fen TEXT NOT NULL, "
+                         "depth INTEGER NOT NULL, state INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+                         "lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, result BLOB, UNIQUE(fen, depth))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, lease_until)")
+
+    def add(self, fens, depth):
+        """Queue FENs; done ones keep their result, failed ones get a fresh set of attempts. {fen: job id}."""
+        fens = list(dict.fromkeys(fens))
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO jobs(fen, depth) VALUES(?, ?) ON CONFLICT(fen, depth) DO UPDATE "
+                                 f"SET state = {PENDING}, attempts = 0 WHERE state = {FAILED}",
+                                 ((f, depth) for f in fens))
+            self._db.execute("COMMIT")
+            ids = {}
+            for lo in range(0, len(fens), 900):
+                chunk = fens[lo:lo + 900]
+                ids.update(self._db.execute(f"SELECT fen, id FROM jobs WHERE depth = ? AND fen IN "
+                                            f"({','.join('?' * len(chunk))})", [depth, *chunk]))
+        return ids
+
+    def lease(self, worker, n):
+        """Up to n pending jobs as (id, fen, depth), now leased to `worker`."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._expire(now)
+            rows = self._db.execute("SELECT id, fen, depth FROM jobs WHERE state = ? ORDER BY id LIMIT ?",
+                                    (PENDING, int(n))).fetchall()
+            self._db.executemany("UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 "
+                                 "WHERE id = ?", ((LEASED, worker, now + self.lease_seconds, r[0]) for r in rows))
+            self._db.execute("COMMIT")
+        return rows
+
+    def renew(self, worker, ids):
+        """Extend `worker`'s leases on these jobs by lease_seconds; returns how many it still held."""
+        ids, until, n = list(ids), time.time() + self.lease_seconds, 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            for lo in range(0, len(ids), 900):
+                chunk = ids[lo:lo + 900]
+                n += self._db.execute(f"UPDATE jobs SET lease_until = ? WHERE state = ? AND worker = ? AND id IN "
+                                      f"({','.join('?' * len(chunk))})", [until, LEASED, worker, *chunk]).rowcount
+            self._db.execute("COMMIT")
+        return n
+
+    def complete(self, results):
+        """results: (job id, packed Eval or None); a None puts the job back for another worker."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            for job, packed in results:
+                if packed:
+                    self._db.execute("UPDATE jobs SET state = ?, result = ?, lease_until = NULL WHERE id = ? "
+                                     "AND state != ?", (DONE, bytes(packed), job, DONE))
+                else:
+                    self._db.execute("UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                                     "lease_until = NULL WHERE id = ? AND state = ?",
+                                     (self.max_attempts, FAILED, PENDING, job, LEASED))
+            self._db.execute("COMMIT")
+
+    def finished(self, ids):
+        """{job id: packed Eval or None (failed)} for those of `ids` that are done or failed."""
+        ids, out = list(ids), {}
+        with self._lock:
+            self._expire(time.time())
+            for lo in range(0, len(ids), 900):
+                chunk = ids[lo:lo + 900]
+                for job, state, result in self._db.execute(
+                        f"SELECT id, state, result FROM jobs WHERE state IN ({DONE}, {FAILED}) AND id IN "
+                        f"({','.join('?' * len(chunk))})", chunk):
+                    out[job] = result if state == DONE else None
+        return out
+
+    def counts(self):
+        with self._lock:
+            got = dict(self._db.execute("SELECT state, count(*) FROM jobs GROUP BY state"))
+        return {name: got.get(s, 0) for s, name in enumerate(("pending", "leased", "done", "failed"))}
+
+    def close(self):
+        with self._lock:
+            try: self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error: pass
+            self._db.close()
+
+    def _expire(self, now):
+        self._db.execute("UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, lease_until = NULL "
+                         "WHERE state = ? AND lease_until < ?", (self.max_attempts, FAILED, PENDING, LEASED, now))
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class Coordinator:
+    """Serves a WorkQueue to workers over XML-RPC and hands finished Evals back to the analysis.
+
+    Pass it as analyze_games(..., engine=coordinator): the batch path then queues
+    its cache misses here instead of running engines locally, and stores what
+    comes back in the position cache as usual. There is no authentication, so
+    bind host to an interface only trusted machines can reach. evaluate() gives
+    up once its jobs have sat unleased, with nothing finishing, for stall_seconds.
+    """
+
+    def __init__(self, path=".cache/work.db", host="127.0.0.1", port=0, lease_seconds=120.0, max_attempts=3,
+                 poll=0.2, stall_seconds=300.0):
+        self.queue, self.poll, self._procs = WorkQueue(path, lease_seconds, max_attempts), poll, []
+        self.stall_seconds = float(stall_seconds)
+        self._server = _Server((host, port), allow_none=True, logRequests=False)
+        self._server.register_function(self._lease, "lease")
+        self._server.register_function(self._complete, "complete")
+        self._server.register_function(self.queue.renew, "renew")
+        self._server.register_function(lambda: self.queue.lease_seconds, "lease_seconds")
+        self._server.register_function(self.queue.counts, "counts")
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="coordinator").start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{socket.gethostname() if host == '0.0.0.0' else host}:{port}"
+
+    def _lease(self, worker, n):
+        return self.queue.lease(worker, n)
+
+    def _complete(self, results):
+        self.queue.complete((job, packed.data if packed else None) for job, packed in results)
+        return True
+
+    def evaluate(self, fens, depth):
+        """Yield (fen, Eval or None) as workers finish them; None once a FEN has used up its attempts.
+
+        Raises RuntimeError when no worker has held a lease or finished a job for stall_seconds.
+        """
+        fens = list(fens)
+        ids = self.queue.add(fens, depth)
+        fen_of, waiting, progress = {v: k for k, v in ids.items()}, set(ids.values()), time.time()
+        while waiting:
+            done = self.queue.finished(waiting)
+            for job, packed in done.items():
+                yield fen_of[job], Eval.unpack(packed) if packed else None
+            waiting -= done.keys()
+            if done or self.queue.counts()["leased"]:
+                progress = time.time()
+            elif waiting and time.time() - progress > self.stall_seconds:
+                raise RuntimeError(f"{len(waiting)} positions still queued in {self.queue.path}, but no worker has "
+                                   f"leased or finished one for {self.stall_seconds:.0f}s")
+            if waiting and not done: time.sleep(self.poll)
+
+    def spawn_local(self, n, stockfish_path, batch=None):
+        """Start n worker processes on this machine, standing in for n nodes.
+
+        They never idle out: they live exactly as long as the coordinator, whose close() stops them.
+        """
+        here = Path(__file__).resolve().parent
+        for i in range(n):
+            self._procs.append(subprocess.Popen([sys.executable, str(here / "WorkQueue.py"), "worker", self.url,
+                                                 stockfish_path, str(batch or 0), "inf"], cwd=here))
+        return self._procs
+
+    def close(self):
+        for p in self._procs:
+            p.terminate()
+        for p in self._procs:
+            p.wait()
+        self._server.shutdown()
+        self._server.server_close()
+        self.queue.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_worker(url, stockfish_path, batch=None, workers=None, threads=None, hash_mb=None, idle_exit=60.0):
+    """Lease, analyse, report, until the coordinator goes away or has had nothing for idle_exit seconds.
+
+    While a batch is in hand its jobs are renewed every third of the lease, so
+    a slow batch isn't handed to another worker meanwhile.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    from EnginePool import EnginePool
+    import ResourcePlan
+    name, rpc = f"{socket.gethostname()}:{os.getpid()}", ServerProxy(url, allow_none=True)
+    p = ResourcePlan.plan(workers, threads, hash_mb)
+    batch, idle_since = batch or 8 * p.engines, time.time()
+
+    def one(job):
+        job_id, fen, depth = job
+        try:
+            return job_id, Binary(Eval.from_info(pool.analyse(chess.Board(fen), chess.engine.Limit(depth=depth)),
+                                                 depth).pack())
+        except Exception:
+            return job_id, None
+
+    with EnginePool(stockfish_path, p.engines, p.threads, p.hash_mb, p.options(), p.cpus) as pool, \
+            ThreadPoolExecutor(pool.size) as ex:
+        try: renew_every = rpc.lease_seconds() / 3
+        except (OSError, ConnectionError): return
+        while True:
+            try: jobs = rpc.lease(name, batch)
+            except (OSError, ConnectionError): return
+            if not jobs:
+                if time.time() - idle_since > idle_exit: return
+                time.sleep(1.0)
+                continue
+            idle_since, futures = time.time(), {ex.submit(one, job): job[0] for job in jobs}
+            pending, renewed = set(futures), time.time()
+            try:
+                while pending:
+                    _, pending = wait(pending, timeout=max(0.0, renewed + renew_every - time.time()),
+                                      return_when=FIRST_COMPLETED)
+                    if pending and time.time() - renewed >= renew_every:
+                        rpc.renew(name, list(futures.values()))  # finished ones too: not reported yet
+                        renewed = time.time()
+                rpc.complete([f.result() for f in futures])
+            except (OSError, ConnectionError): return
+
+
+if __name__ == "__main__":
+    # python WorkQueue.py worker http://coordinator:port /path/to/stockfish [batch [idle_exit]]
+    if len(sys.argv) >= 4 and sys.argv[1] == "worker":
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else None,
+                   idle_exit=float(sys.argv[5]) if len(sys.argv) > 5 else 60.0)
+    else:
+        print("usage: python WorkQueue.py worker URL STOCKFISH [batch [idle_exit]]")
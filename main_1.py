@@ -1,7 +1,6 @@
 import chess
 import Fetchers, CalcHelpers, Stockfish
 from CalcHelpers import print_stats
-import time
 
 
 def main():
@@ -24,23 +23,15 @@ def main():
     # Analyze every game once
     all_games = list(user_games) + list(random_games)
     print("Analyzing all games (single pass)...")
-    all_results = []
-    start_time = time.time()
-    total_positions = 0
-    for i, game in enumerate(all_games):
-        result = Stockfish.analyze_games([game], sf_path, depth, [user],
-                                         True)[0]
-        all_results.append(result)
-        if result:
-            total_positions += len(result[0])
-        elapsed = time.time() - start_time
-        progress = (i + 1) / len(all_games) * 100
-        games_per_sec = (i + 1) / elapsed if elapsed > 0 else 0
-        positions_per_sec = total_positions / elapsed if elapsed > 0 else 0
-        print(
-            f"Analyzing: {progress:.1f}% ({i+1}/{len(all_games)}):    \n   {games_per_sec:.2f} games/sec, \n   {positions_per_sec:.2f} pos/sec",
-            end='\r')
-    print()
+    # finished games are appended to the manifest as they complete; a rerun skips them
+    all_results = Stockfish.analyze_games(all_games, sf_path, depth, [user],
+                                          True, manifest=f"runs/depth{depth}.jsonl")
+    if st := Stockfish.pool_stats():
+        print(f"  {st['games_per_sec']:.2f} games/sec, {st['positions_per_sec']:.2f} pos/sec"
+              f" ({st['positions']} engine positions, {st['restarts']} restarts)")
+    if rs := Stockfish.resolver_stats():
+        print("  positions by route: " + ", ".join(f"{k} {v}" for k, v in rs.items()))
+    Stockfish.close_pool()
 
     # Split results
     ulen = len(user_games)
@@ -62,7 +53,7 @@ def main():
 
     # Sort and split random games by ELO
     sorted_pairs = sorted(zip(random_games, random_results),
-                          key=lambda x: (x[1][4] or 0) if x[1] else 0)
+                          key=lambda x: (x[1].elo or 0) if x[1] else 0)
     n = len(sorted_pairs)
     bott_games, bott_results = zip(*sorted_pairs[:int(n *
                                                       0.19)]) if n else ([],
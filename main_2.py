@@ -24,4 +24,4 @@ with open('ChessUsers.csv', 'r') as file:
     reader = csv.DictReader(file)
     for row in reader:
         user_list.append(row['username'])
-Fetchers.fetch_all_users_games(user_list, 50, True)
+Fetchers.fetch_all_users_games(user_list, verbose=True, per_user=50)
@@ -0,0 +1,84 @@
+"""Threaded get/put/get_many/flush/prune against one DiskMemCache, both backends.
+
+Every lookup must be counted exactly once, as a hit or a miss, however the
+threads interleave with the writer, flushes and pruning. Also runnable directly:
+python tests/test_diskmemcache_stress.py [threads] [ops per thread]
+"""
+import random, sys, threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import chess
+
+from DiskMemCache import DiskMemCache
+from EvalRecord import Eval
+
+
+def _fens(n, seed=1):
+    r, b, fens = random.Random(seed), chess.Board(), []
+    while len(fens) < n:
+        if b.is_game_over() or len(b.move_stack) > 80: b = chess.Board()
+        b.push(r.choice(list(b.legal_moves)))
+        fens.append(b.fen())
+    return fens
+
+
+def stress(path, threads=8, ops=4000, fens=None):
+    """Hammer one cache from `threads` threads; returns (lookups made, cache stats)."""
+    fens = fens or _fens(6000)
+    c = DiskMemCache(path, max_cache_size=1000, flush_interval=0.05, check_interval=97)
+    c.load()
+    lookups, errors = [0] * threads, []
+
+    def work(t):
+        r = random.Random(t)
+        try:
+            for i in range(ops):
+                f = fens[r.randrange(len(fens))]
+                if c.get(f, 8) is None: c.put(f, 8, Eval(cp=i % 300, depth=8))
+                lookups[t] += 1
+                if i % 250 == 0:
+                    hits, misses = c.get_many((fens[r.randrange(len(fens))], 8) for _ in range(50))
+                    c.put_many((f, 8, Eval(cp=1, depth=8)) for f, _ in misses[:10])
+                    lookups[t] += 50
+                if t == 0 and i % 1000 == 0:
+                    c.flush()
+                    c.force_prune()
+        except Exception as e:
+            errors.append(repr(e))
+
+    ts = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    for t in ts: t.start()
+    for t in ts: t.join()
+    st = c.stats()
+    c.close()
+    assert not errors, errors[:3]
+    return sum(lookups), st
+
+
+def _check(path, **kw):
+    n, st = stress(path, **kw)
+    assert st["hits"] + st["misses"] == n, (st["hits"], st["misses"], n)
+    assert st["cache_size"] <= 1000 + st["shards"]
+    reopened = DiskMemCache(path, periodic_save=False)
+    reopened.load()
+    assert len(reopened) or reopened.backend == "sqlite"
+    reopened.close()
+
+
+def test_stress_pickle(tmp_path):
+    _check(tmp_path / "cache.pkl.gz")
+
+
+def test_stress_sqlite(tmp_path):
+    _check(tmp_path / "cache.db")
+
+
+if __name__ == "__main__":
+    import tempfile, time
+    kw = dict(zip(("threads", "ops"), map(int, sys.argv[1:3])))
+    with tempfile.TemporaryDirectory() as d:
+        for name in ("cache.pkl.gz", "cache.db"):
+            t = time.perf_counter()
+            _check(Path(d) / name, **kw)
+            print(f"  ✓ {name}: {time.perf_counter() - t:.2f}s")
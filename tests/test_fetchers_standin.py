@@ -0,0 +1,192 @@
+"""Fetchers against a local http.server stand-in for the chess.com API.
+
+Checks that a 429 is retried after its Retry-After, that synced months are
+revalidated with conditional requests (and a 304 keeps the stored games),
+that games come back newest first, and that a small n stops users from being
+started. Also runnable directly: python tests/test_fetchers_standin.py
+"""
+import calendar, json, os, sys, tempfile, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+USERS = ("alice", "bob", "carol", "dave")
+PER_MONTH = 4
+
+
+def _months(k=3):
+    """This month and the k-1 before it, oldest first; the last one is still live."""
+    y, m = time.gmtime()[:2]
+    out = []
+    for _ in range(k):
+        out.append((y, m))
+        y, m = (y, m - 1) if m > 1 else (y - 1, 12)
+    return out[::-1]
+
+
+def api_data():
+    """Path -> JSON body for every endpoint the stand-in serves."""
+    data, i = {}, 0
+    for u in USERS:
+        archives = []
+        for y, m in _months():
+            games = []
+            for k in range(PER_MONTH):
+                pgn = (f'[Event "Live Chess"]\n[White "{u}"]\n[Black "opp{i}"]\n[Result "1-0"]\n'
+                       f'[UTCDate "{y}.{m:02d}.{k + 1:02d}"]\n[UTCTime "12:00:00"]\n\n1. e4 e5 2. Nf3 Nc6 1-0\n')
+                games.append({"url": f"https://www.chess.com/game/live/{i}", "pgn": pgn,
+                              "end_time": calendar.timegm((y, m, k + 1, 12, 0, 0)),
+                              "time_class": "blitz" if k % 2 else "rapid"})
+                i += 1
+            data[f"/pub/player/{u}/games/{y}/{m:02d}"] = {"games": games}
+            archives.append(f"https://api.chess.com/pub/player/{u}/games/{y}/{m:02d}")
+        data[f"/pub/player/{u}/games/archives"] = {"archives": archives}
+        data[f"/pub/player/{u}"] = {"country": "https://api.chess.com/pub/country/US"}
+    return data
+
+
+class StandIn:
+    """Serves api_data() with ETags and 304s; paths in throttle get one 429 first."""
+
+    def __init__(self, throttle=(), retry_after=1):
+        data, self.log, seen = api_data(), [], set()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args): pass
+
+            def do_GET(self):
+                stand_in.log.append((time.monotonic(), self.path, self.headers.get("If-None-Match")))
+                if self.path in throttle and self.path not in seen:
+                    seen.add(self.path)
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(retry_after))
+                    self.end_headers()
+                    return
+                if self.path not in data:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                etag = f'"{sorted(data).index(self.path)}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                body = json.dumps(data[self.path]).encode()
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self._server.server_port}/pub"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def requests(self, since=0):
+        return [(path, etag) for _, path, etag in self.log[since:]]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def fetchers(tmp, base, setattr=setattr):
+    """Fetchers pointed at the stand-in, with its cache and game store under tmp."""
+    cwd = os.getcwd()
+    os.chdir(tmp)  # the import makes its cache directory in the working directory
+    try: import Fetchers
+    finally: os.chdir(cwd)
+    from GameStore import GameStore
+    setattr(Fetchers, "API_BASE", base)
+    setattr(Fetchers, "_cache_dir", Path(tmp))
+    setattr(Fetchers, "_games", GameStore(Path(tmp) / "games.db"))
+    return Fetchers
+
+
+def _links(games):
+    return [g.headers["Link"] for g in games]
+
+
+def check_retry_after(tmp, setattr=setattr):
+    y, m = _months()[-1]
+    path = f"/pub/player/alice/games/{y}/{m:02d}"
+    api = StandIn(throttle={path})
+    try:
+        F = fetchers(tmp, api.base, setattr)
+        games = F.fetch_all_users_games(["alice"])
+        hits = [t for t, p, _ in api.log if p == path]
+        assert len(games) == 3 * PER_MONTH
+        assert len(hits) == 2 and hits[1] - hits[0] >= 0.9, hits
+    finally:
+        api.close()
+
+
+def check_conditional_requests(tmp, setattr=setattr):
+    api = StandIn()
+    try:
+        F = fetchers(tmp, api.base, setattr)
+        first = F.fetch_all_users_games(["alice"])
+        mark = len(api.log)
+        assert _links(F.fetch_all_users_games(["alice"])) == _links(first)
+        assert api.requests(mark) == []  # synced months are read from the store
+        again = F.fetch_all_users_games(["alice"], refresh=True)
+        y, m = _months()[-1]
+        sent = dict(api.requests(mark))
+        # the archive list already has this month and the older months are closed,
+        # so only the live month is asked for again, conditionally, and gets a 304
+        assert list(sent) == [f"/pub/player/alice/games/{y}/{m:02d}"] and all(sent.values()), sent
+        assert _links(again) == _links(first)
+    finally:
+        api.close()
+
+
+def check_newest_first(tmp, setattr=setattr):
+    api = StandIn()
+    try:
+        F = fetchers(tmp, api.base, setattr)
+        games = F.fetch_all_users_games(["bob"])
+        ends = [calendar.timegm(time.strptime(g.headers["UTCDate"], "%Y.%m.%d")) for g in games]
+        assert len(games) == 3 * PER_MONTH and ends == sorted(ends, reverse=True)
+        newest = F.fetch_all_users_games(["carol"], per_user=PER_MONTH + 1)
+        assert _links(newest) == _links(F.fetch_all_users_games(["carol"]))[:PER_MONTH + 1]
+        oldest = F.fetch_all_users_games(["carol"], newest_first=False)
+        assert _links(oldest) == _links(F.fetch_all_users_games(["carol"]))[::-1]
+    finally:
+        api.close()
+
+
+def check_n_stops_users(tmp, setattr=setattr):
+    api = StandIn()
+    try:
+        F = fetchers(tmp, api.base, setattr)
+        games = F.fetch_all_users_games(list(USERS), PER_MONTH)
+        asked = {p.split("/")[3] for p, _ in api.requests()}
+        assert len(games) == PER_MONTH and asked == {"alice"}, asked
+    finally:
+        api.close()
+
+
+def test_retry_after(tmp_path, monkeypatch):
+    check_retry_after(tmp_path, monkeypatch.setattr)
+
+
+def test_conditional_requests(tmp_path, monkeypatch):
+    check_conditional_requests(tmp_path, monkeypatch.setattr)
+
+
+def test_newest_first(tmp_path, monkeypatch):
+    check_newest_first(tmp_path, monkeypatch.setattr)
+
+
+def test_n_stops_users(tmp_path, monkeypatch):
+    check_n_stops_users(tmp_path, monkeypatch.setattr)
+
+
+if __name__ == "__main__":
+    for check in (check_retry_after, check_conditional_requests, check_newest_first, check_n_stops_users):
+        with tempfile.TemporaryDirectory() as d:
+            check(d)
+            print(f"  ✓ {check.__name__[6:]}")
@@ -0,0 +1,123 @@
+"""The NumPy Frame metrics against the list-comprehension versions they replaced, on fixed synthetic results.
+
+The baseline functions below are the pre-Frame CalcHelpers code, kept verbatim
+(over 12-field tuples) as the reference. Also runnable directly:
+python tests/test_metrics_frame.py [games]
+"""
+import math, random, sys
+from collections import defaultdict
+from dataclasses import astuple
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import CalcHelpers
+from GameResult import GameResult
+
+
+# ---------- baseline (before the Frame) ----------
+
+def _pdiff(results):
+    return [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for ev,_,_,c,*_ in results for i in range(1,len(ev)) if c is None or i%2==c]
+
+def _metric(results, fn):
+    diffs = fn(results)
+    return sum(diffs)/len(diffs) if diffs else 0
+
+BASELINE_METRICS = {
+    'acpl': lambda r: _metric(r, _pdiff),
+    'sharpness': lambda r: _metric(r, lambda x: [abs(ev[i]-ev[i-1]) for ev,*_ in x for i in range(1,len(ev))]),
+    'closedness': lambda r: _metric(r, lambda x: [pc for _,_,pws,*_ in x for pc in pws]),
+    'resign_rate': lambda r: (100*sum(1 for x in lost if x[8])/len(lost) if (lost:=[x for x in r if x[7] is False]) else 0),
+    'best_move_rate': lambda r: 100*_metric(r, lambda x: [b for *_,bms,_,_ in x for b in bms]),
+}
+
+def baseline_pmetrics(results):
+    acpl, cnt = defaultdict(float), defaultdict(int)
+    for ev,pcs,_,c,*_ in results:
+        for i in range(1,len(ev)):
+            if c is None or i%2==c:
+                diff = max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1])
+                acpl[pcs[i-1]] += diff
+                cnt[pcs[i-1]] += 1
+    total_moves = sum(cnt.values()) or 1
+    return {p: acpl[p]/cnt[p] for p in acpl if cnt[p]}, {p: 100*cnt[p]/total_moves for p in cnt}
+
+def baseline_tmetrics(results):
+    acpl, wins = defaultdict(list), defaultdict(lambda:[0,0])
+    for ev,_,_,c,_,_,_,won,_,_,h,_ in results:
+        if h is not None:
+            diffs = [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for i in range(1,len(ev)) if c is None or i%2==c]
+            if diffs: acpl[h].extend(diffs)
+            if won is not None: wins[h][won] += 1
+    return {h:sum(d)/len(d) for h,d in acpl.items() if d}, {h:100*v[1]/sum(v) if sum(v) else 0 for h,v in wins.items()}
+
+def baseline_gmetrics(results):
+    acpl, wins = defaultdict(list), defaultdict(lambda:[0,0])
+    for ev,_,_,c,_,_,_,won,_,_,_,gn in results:
+        if gn is not None:
+            diffs = [max(0, ev[i-1]-ev[i] if i%2 else ev[i]-ev[i-1]) for i in range(1,len(ev)) if c is None or i%2==c]
+            if diffs: acpl[gn].extend(diffs)
+            if won is not None: wins[gn][won] += 1
+    return {g:sum(d)/len(d) for g,d in acpl.items() if d}, {g:100*v[1]/sum(v) if sum(v) else 0 for g,v in wins.items()}
+
+
+# ---------- fixed synthetic results ----------
+
+def synth(n, seed=1):
+    """n GameResults covering the edge cases: empty games, clamped evals, untracked sides, missing fields."""
+    r, out = random.Random(seed), []
+    for _ in range(n):
+        k = r.randint(0, 90)
+        castled = r.random() >= .3
+        out.append(GameResult(
+            evals=[r.choice([r.randint(-800, 800), 800, -800]) for _ in range(k)],
+            piece_types=[r.randint(1, 6) for _ in range(k)],
+            pawn_counts=[r.randint(0, 16) for _ in range(k + r.randint(0, 2))],
+            color=r.choice([True, False, None]),
+            elo=r.randint(0, 2800),
+            castle_turn=r.choice([3, 5, 7, 9, 11, 14, 20]) if castled else None,
+            castle_side=r.choice(["K", "Q"]) if castled else None,
+            won=r.choice([None, True, False]),
+            is_resignation=r.random() < .5,
+            best_moves=[r.random() < .3 for _ in range(k // 2)],
+            hour=r.choice([None, *range(24)]),
+            game_num=r.choice([None, 1, 2, 3, 4, 12])))
+    return out
+
+
+def _as_tuples(results):
+    return [tuple(list(v) if hasattr(v, "typecode") else v for v in astuple(g)) for g in results]
+
+
+def _close(a, b):
+    if isinstance(a, dict):
+        return isinstance(b, dict) and a.keys() == b.keys() and all(_close(a[k], b[k]) for k in a)
+    if isinstance(a, tuple):
+        return isinstance(b, tuple) and len(a) == len(b) and all(map(_close, a, b))
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def compare(results):
+    """Names of the metrics where the Frame disagrees with the baseline (empty when all match)."""
+    rows, frame = _as_tuples(results), CalcHelpers.Frame(results)
+    pairs = [(f"METRICS[{k!r}]", BASELINE_METRICS[k](rows), CalcHelpers.METRICS[k](frame)) for k in BASELINE_METRICS]
+    pairs += [(name, base(rows), getattr(CalcHelpers, name)(results))
+              for name, base in (("pmetrics", baseline_pmetrics), ("tmetrics", baseline_tmetrics),
+                                 ("gmetrics", baseline_gmetrics))]
+    return [name for name, want, got in pairs if not _close(want, got)]
+
+
+def test_frame_matches_baseline():
+    assert compare(synth(400)) == []
+
+
+def test_frame_matches_baseline_small_and_empty():
+    for n in (0, 1, 3):
+        assert compare(synth(n, seed=n + 7)) == []
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    bad = compare(synth(n))
+    print(f"  {'✓ all metrics match' if not bad else '! mismatched: ' + ', '.join(bad)} over {n} games")
+    sys.exit(1 if bad else 0)